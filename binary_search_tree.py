@@ -1,6 +1,15 @@
 """
 Python code to implement functions for a Binary Search Tree
 """
+from array import array
+from collections import deque
+from itertools import islice
+
+from tree_utils import (BATCH_REBUILD_RATIO, check_option, merge_batch, reject_duplicates,
+                        reject_missing, sorted_keys, subtract_batch)
+
+
+NIL = 0  # Index of the empty tree in ArrayBST
 
 class TreeNode:
     """
@@ -12,6 +21,7 @@ class TreeNode:
         self.right = None
         self.height = 1
 
+
 class BST:
     """
     Python class for a Binary Search Tree
@@ -19,111 +29,426 @@ class BST:
 
     def lookup(self, root, key):
         """
-        Recursive function to lookup the node which has the same value as the given key.
+        Iterative function to lookup the node which has the same value as the given key.
         Return the node if it meets the requirement.
         Return None if the node isn't exist.
         """
 
-        if not root:
-            return None
-
-        if key < root.val:
-            return self.lookup(root.left, key) if root.left is not None else None
-        if key > root.val:
-            return self.lookup(root.right, key) if root.right is not None else None
-        return root
+        node = root
+        while node is not None:
+            if key < node.val:
+                node = node.left
+            elif key > node.val:
+                node = node.right
+            else:
+                return node
+        return None
 
     def insert(self, root, key):
         """
-        Recursive function to insert key in subtree rooted with node
+        Iterative function to insert key in subtree rooted with node
         and returns new root of subtree.
+        The path from root to the new node is kept in a list instead of Python frames,
+        so a degenerate (sorted input) tree doesn't hit the recursion limit.
         """
 
         if not root:
             return TreeNode(key)
 
-        if key < root.val:
-            root.left = self.insert(root.left, key)
-        else:
-            root.right = self.insert(root.right, key)
+        path = []
+        node = root
+        while node is not None:
+            path.append(node)
+            node = node.left if key < node.val else node.right
 
-        root.height = 1 + max(self._get_height(root.left), self._get_height(root.right))
+        parent = path[-1]
+        if key < parent.val:
+            parent.left = TreeNode(key)
+        else:
+            parent.right = TreeNode(key)
 
+        self._update_path_heights(path)
         return root
 
     def delete(self, root, key):
         """
-        Recursive function to delete a node with the given key from subtree with given root.
+        Iterative function to delete a node with the given key from subtree with given root.
         It returns root of the modified subtree.
         """
 
-        if not root:
-            return root
+        path = []
+        node = root
+        while node is not None and key != node.val:
+            path.append(node)
+            node = node.left if key < node.val else node.right
 
-        if key < root.val:
-            root.left = self.delete(root.left, key)
-        elif key > root.val:
-            root.right = self.delete(root.right, key)
-        else:
-            # The node to be deleted only have a right child
-            # or it is a leaf node.
-            if root.left is None:
-                temp = root.right
-                root = None
-                return temp
-
-            # The node to be deleted only have a left child.
-            if root.right is None:
-                temp = root.left
-                root = None
-                return temp
+        if node is None:
+            return root
 
+        if node.left is not None and node.right is not None:
             # The node to be deleted have both left and right child.
-            # Replace value with the immediate in_order successor (must be a leaf)
+            # Replace value with the immediate in_order successor
             # and then remove that successor.
-            temp = self._get_successor(root)
-            root.val = temp.val
-            root.right = self.delete(root.right, temp.val)
+            path.append(node)
+            successor = node.right
+            while successor.left is not None:
+                path.append(successor)
+                successor = successor.left
+            node.val = successor.val
+            node = successor
+
+        # The node to be deleted only have one child or it is a leaf node.
+        child = node.left if node.left is not None else node.right
+
+        # If the deleted node is the root, its child is the new root
+        if not path:
+            return child
+
+        parent = path[-1]
+        if parent.left is node:
+            parent.left = child
+        else:
+            parent.right = child
+
+        self._update_path_heights(path)
+        return root
+
+    def insert_many(self, root, keys, on_duplicate='keep'):
+        """
+        Insert a batch of keys and return the new root.
+
+        The batch is sorted first. If the tree holds at most BATCH_REBUILD_RATIO times as
+        many keys as the batch, its nodes and the new ones are merged in key order and
+        relinked into a balanced tree in O(n + k).
+        Otherwise the keys are inserted one by one in ascending order.
+        on_duplicate: what to do with a key already in the tree or repeated in the batch.
+            'keep' inserts it anyway (like insert), 'skip' ignores it,
+            'error' raises KeyError before the tree is modified.
+        """
+
+        check_option('on_duplicate', on_duplicate, ('keep', 'skip', 'error'))
+        batch = sorted(keys)
+        nodes = self._collect_nodes(root, len(batch) * BATCH_REBUILD_RATIO)
+        if nodes is not None:
+            nodes = merge_batch(nodes, batch, on_duplicate, TreeNode)
+            return self._link_balanced(nodes, 0, len(nodes))
+
+        if on_duplicate == 'error':
+            reject_duplicates(batch, lambda key: self.lookup(root, key) is not None)
+        for key in batch:
+            if on_duplicate == 'keep' or self.lookup(root, key) is None:
+                root = self.insert(root, key)
+        return root
 
-        root.height = 1 + max(self._get_height(root.left), self._get_height(root.right))
+    def delete_many(self, root, keys, on_missing='ignore'):
+        """
+        Delete a batch of keys (one copy per occurrence in the batch) and return the new root.
+        Same strategy as insert_many: relink the remaining nodes, or delete key by key.
+        on_missing: 'ignore' skips a key which is not in the tree,
+            'error' raises KeyError before the tree is modified.
+        """
 
+        check_option('on_missing', on_missing, ('ignore', 'error'))
+        batch = sorted(keys)
+        nodes = self._collect_nodes(root, len(batch) * BATCH_REBUILD_RATIO)
+        if nodes is not None:
+            nodes = subtract_batch(nodes, batch, on_missing)
+            return self._link_balanced(nodes, 0, len(nodes))
+
+        if on_missing == 'error':
+            def count(key, limit):
+                return sum(1 for _ in islice(self.range(root, key, key), limit))
+            reject_missing(batch, count)
+        for key in batch:
+            root = self.delete(root, key)
         return root
 
+    @staticmethod
+    def _collect_nodes(root, limit):
+        """
+        Return the list of nodes in key order, or None if there are more than limit.
+        """
+
+        nodes = []
+        stack = []
+        node = root
+        while stack or node is not None:
+            while node is not None:
+                stack.append(node)
+                node = node.left
+            node = stack.pop()
+            nodes.append(node)
+            if len(nodes) > limit:
+                return None
+            node = node.right
+        return nodes
+
+    def range(self, root, lo=None, hi=None, inclusive=(True, True)):
+        """
+        Generator yielding, in ascending order, the keys between lo and hi.
+        lo/hi: None means unbounded on that side.
+        inclusive: pair of booleans telling whether lo and hi themselves are included.
+        Cost is O(log(n) + k): one descent to the first key, then an inorder walk.
+        """
+
+        lo_inclusive, hi_inclusive = inclusive
+
+        # Descend to the first key in range, keeping the nodes still to be visited
+        stack = []
+        node = root
+        while node is not None:
+            if lo is None or lo < node.val or (lo_inclusive and lo == node.val):
+                stack.append(node)
+                node = node.left
+            else:
+                node = node.right
+
+        # Inorder walk from there until a key passes hi
+        while stack:
+            node = stack.pop()
+            if hi is not None and (hi < node.val or (not hi_inclusive and hi == node.val)):
+                return
+            yield node.val
+            node = node.right
+            while node is not None:
+                stack.append(node)
+                node = node.left
+
+    def floor(self, root, key):
+        """
+        Return the largest key less than or equal to the given key, or None.
+        """
+
+        return self._closest_below(root, key, True)
+
+    def ceiling(self, root, key):
+        """
+        Return the smallest key greater than or equal to the given key, or None.
+        """
+
+        return self._closest_above(root, key, True)
+
+    def predecessor(self, root, key):
+        """
+        Return the largest key strictly less than the given key, or None.
+        """
+
+        return self._closest_below(root, key, False)
+
+    def successor(self, root, key):
+        """
+        Return the smallest key strictly greater than the given key, or None.
+        """
+
+        return self._closest_above(root, key, False)
+
+    @staticmethod
+    def _closest_below(root, key, inclusive):
+        """
+        Descend from root, remembering the last key which is below (or equal to) key.
+        """
+
+        ret = None
+        node = root
+        while node is not None:
+            if node.val < key or (inclusive and node.val == key):
+                ret = node.val
+                node = node.right
+            else:
+                node = node.left
+        return ret
+
+    @staticmethod
+    def _closest_above(root, key, inclusive):
+        """
+        Descend from root, remembering the last key which is above (or equal to) key.
+        """
+
+        ret = None
+        node = root
+        while node is not None:
+            if key < node.val or (inclusive and node.val == key):
+                ret = node.val
+                node = node.left
+            else:
+                node = node.right
+        return ret
+
+    @staticmethod
+    def from_sorted(iterable, sort=False, dedupe=False):
+        """
+        Build a height-balanced BST from keys in ascending order and return its root.
+        The middle key of every range becomes the subtree root, so the build is O(n).
+        sort: sort the keys first instead of requiring sorted input.
+        dedupe: keep only one copy of repeated keys.
+        """
+
+        keys = sorted_keys(iterable, sort, dedupe)
+        return BST._link_balanced([TreeNode(key) for key in keys], 0, len(keys))
+
+    @staticmethod
+    def _link_balanced(nodes, lo, hi):
+        """
+        Link nodes[lo:hi] (in key order) into a balanced subtree and return its root
+        (recursion depth is log(n)).
+        """
+
+        if lo >= hi:
+            return None
+
+        mid = (lo + hi) // 2
+        node = nodes[mid]
+        node.left = BST._link_balanced(nodes, lo, mid)
+        node.right = BST._link_balanced(nodes, mid + 1, hi)
+        node.height = 1 + max(BST._get_height(node.left), BST._get_height(node.right))
+        return node
+
     def pre_order(self, root):
         """
         Print BST in preorder.
         """
 
-        if not root:
-            return
-
-        print(f"{root.val}")
-        self.pre_order(root.left)
-        self.pre_order(root.right)
+        for val in self.iter_pre_order(root):
+            print(f"{val}")
 
     def in_order(self, root):
         """
         Print BST in inorder.
         """
 
-        if not root:
-            return
-
-        self.in_order(root.left)
-        print(f"{root.val}")
-        self.in_order(root.right)
+        for val in self.iter_in_order(root):
+            print(f"{val}")
 
     def post_order(self, root):
         """
         Print BST in postorder.
         """
 
-        if not root:
-            return
+        for val in self.iter_post_order(root):
+            print(f"{val}")
+
+    def level_order(self, root):
+        """
+        Print the tree in levelorder.
+        """
+
+        for val in self.iter_level_order(root):
+            print(f"{val}")
+
+    def iter_pre_order(self, root):
+        """
+        Generator yielding the keys in preorder.
+        Iterative, the pending right children use O(height) memory.
+        """
+
+        stack = [root] if root is not None else []
+        while stack:
+            node = stack.pop()
+            yield node.val
+            if node.right is not None:
+                stack.append(node.right)
+            if node.left is not None:
+                stack.append(node.left)
+
+    def iter_in_order(self, root):
+        """
+        Generator yielding the keys in inorder (ascending).
+        Iterative, the stack holds one path of the tree.
+        """
+
+        stack = []
+        node = root
+        while stack or node is not None:
+            while node is not None:
+                stack.append(node)
+                node = node.left
+            node = stack.pop()
+            yield node.val
+            node = node.right
+
+    def iter_reverse_order(self, root):
+        """
+        Generator yielding the keys in reverse inorder (descending).
+        """
+
+        stack = []
+        node = root
+        while stack or node is not None:
+            while node is not None:
+                stack.append(node)
+                node = node.right
+            node = stack.pop()
+            yield node.val
+            node = node.left
+
+    def iter_post_order(self, root):
+        """
+        Generator yielding the keys in postorder.
+        Iterative, a node is yielded once its right subtree (the last one visited) is done.
+        """
+
+        stack = []
+        node = root
+        last = None
+        while stack or node is not None:
+            if node is not None:
+                stack.append(node)
+                node = node.left
+                continue
+            top = stack[-1]
+            if top.right is not None and top.right is not last:
+                node = top.right
+            else:
+                yield top.val
+                last = stack.pop()
+
+    def iter_level_order(self, root):
+        """
+        Generator yielding the keys in levelorder.
+        The queue is a deque, so every step is O(1).
+        """
+
+        queue = deque([root] if root is not None else [])
+        while queue:
+            node = queue.popleft()
+            yield node.val
+            if node.left is not None:
+                queue.append(node.left)
+            if node.right is not None:
+                queue.append(node.right)
 
-        self.post_order(root.left)
-        self.post_order(root.right)
-        print(f"{root.val}")
+    def iter_levels(self, root):
+        """
+        Generator yielding (depth, key) in levelorder, depth 0 being the root.
+        Each level is a list scanned while the next one is built,
+        so at most two levels are held at a time.
+        """
+
+        level = [root] if root is not None else []
+        depth = 0
+        while level:
+            next_level = []
+            for node in level:
+                yield depth, node.val
+                if node.left is not None:
+                    next_level.append(node.left)
+                if node.right is not None:
+                    next_level.append(node.right)
+            level = next_level
+            depth += 1
+
+    def _update_path_heights(self, path):
+        """
+        Given the root-to-parent path of an inserted/deleted node, update heights
+        from bottom to top. Stop as soon as a height is unchanged.
+        """
+
+        while path:
+            node = path.pop()
+            new_height = 1 + max(self._get_height(node.left), self._get_height(node.right))
+            if new_height == node.height:
+                break
+            node.height = new_height
 
     @staticmethod
     def _get_successor(node):
@@ -151,6 +476,264 @@ class BST:
 
         return node.height
 
+
+class ArrayBST:
+    """
+    Binary Search Tree class with struct-of-arrays node storage.
+
+    A node is an integer index into the parallel arrays self.val, self.left,
+    self.right and self.height instead of a TreeNode object. Index 0 (NIL) is the
+    empty tree, its height is 0 so no None check is needed when reading heights.
+    Slots of deleted nodes are chained through self.left into a free-list.
+
+    The methods mirror BST: insert/delete take and return a root index,
+    lookup returns the index of the node or None.
+    """
+
+    def __init__(self):
+        self.val = [None]
+        self.left = array('i', [NIL])
+        self.right = array('i', [NIL])
+        self.height = array('i', [0])
+        self.free = NIL
+
+    def lookup(self, root, key):
+        """
+        Iterative function to lookup the node which has the same value as the given key.
+        Return the index of the node if it meets the requirement.
+        Return None if the node isn't exist.
+        """
+
+        val, left, right = self.val, self.left, self.right
+        node = root
+        while node != NIL:
+            node_val = val[node]
+            if key < node_val:
+                node = left[node]
+            elif key > node_val:
+                node = right[node]
+            else:
+                return node
+        return None
+
+    def insert(self, root, key):
+        """
+        Insert key in the tree rooted with root and return the new root index.
+        """
+
+        val, left, right = self.val, self.left, self.right
+
+        path = []
+        node = root
+        while node != NIL:
+            path.append(node)
+            node = left[node] if key < val[node] else right[node]
+
+        new_node = self._new_node(key)
+        if not path:
+            return new_node
+        parent = path[-1]
+        if key < val[parent]:
+            left[parent] = new_node
+        else:
+            right[parent] = new_node
+
+        self._update_path_heights(path)
+        return root
+
+    def delete(self, root, key):
+        """
+        Delete a node with the given key from the tree rooted with root.
+        It returns the new root index.
+        """
+
+        val, left, right = self.val, self.left, self.right
+
+        path = []
+        node = root
+        while node != NIL:
+            node_val = val[node]
+            if key == node_val:
+                break
+            path.append(node)
+            node = left[node] if key < node_val else right[node]
+        if node == NIL:
+            return root
+
+        if left[node] != NIL and right[node] != NIL:
+            # The node to be deleted have both left and right child.
+            # Replace value with the immediate in_order successor
+            # and then remove that successor.
+            path.append(node)
+            successor = right[node]
+            while left[successor] != NIL:
+                path.append(successor)
+                successor = left[successor]
+            val[node] = val[successor]
+            node = successor
+
+        # The node to be deleted has at most one child now.
+        child = left[node] if left[node] != NIL else right[node]
+        self._free_node(node)
+        if not path:
+            return child
+
+        parent = path[-1]
+        if left[parent] == node:
+            left[parent] = child
+        else:
+            right[parent] = child
+
+        self._update_path_heights(path)
+        return root
+
+    def iter_pre_order(self, root):
+        """
+        Generator yielding the keys in preorder.
+        """
+
+        val, left, right = self.val, self.left, self.right
+        stack = [root] if root != NIL else []
+        while stack:
+            node = stack.pop()
+            yield val[node]
+            if right[node] != NIL:
+                stack.append(right[node])
+            if left[node] != NIL:
+                stack.append(left[node])
+
+    def iter_in_order(self, root):
+        """
+        Generator yielding the keys in inorder (ascending).
+        """
+
+        val, left, right = self.val, self.left, self.right
+        stack = []
+        node = root
+        while stack or node != NIL:
+            while node != NIL:
+                stack.append(node)
+                node = left[node]
+            node = stack.pop()
+            yield val[node]
+            node = right[node]
+
+    def iter_reverse_order(self, root):
+        """
+        Generator yielding the keys in reverse inorder (descending).
+        """
+
+        val, left, right = self.val, self.left, self.right
+        stack = []
+        node = root
+        while stack or node != NIL:
+            while node != NIL:
+                stack.append(node)
+                node = right[node]
+            node = stack.pop()
+            yield val[node]
+            node = left[node]
+
+    def iter_post_order(self, root):
+        """
+        Generator yielding the keys in postorder.
+        """
+
+        val, left, right = self.val, self.left, self.right
+        stack = []
+        node = root
+        last = NIL
+        while stack or node != NIL:
+            if node != NIL:
+                stack.append(node)
+                node = left[node]
+                continue
+            top = stack[-1]
+            if right[top] != NIL and right[top] != last:
+                node = right[top]
+            else:
+                yield val[top]
+                last = stack.pop()
+
+    def iter_level_order(self, root):
+        """
+        Generator yielding the keys in levelorder.
+        """
+
+        val, left, right = self.val, self.left, self.right
+        queue = deque([root] if root != NIL else [])
+        while queue:
+            node = queue.popleft()
+            yield val[node]
+            if left[node] != NIL:
+                queue.append(left[node])
+            if right[node] != NIL:
+                queue.append(right[node])
+
+    def iter_levels(self, root):
+        """
+        Generator yielding (depth, key) in levelorder, depth 0 being the root.
+        """
+
+        val, left, right = self.val, self.left, self.right
+        level = [root] if root != NIL else []
+        depth = 0
+        while level:
+            next_level = []
+            for node in level:
+                yield depth, val[node]
+                if left[node] != NIL:
+                    next_level.append(left[node])
+                if right[node] != NIL:
+                    next_level.append(right[node])
+            level = next_level
+            depth += 1
+
+    def _update_path_heights(self, path):
+        """
+        Given the root-to-parent path of an inserted/deleted node, update heights
+        from bottom to top. Stop as soon as a height is unchanged.
+        """
+
+        left, right, height = self.left, self.right, self.height
+        while path:
+            node = path.pop()
+            h_left = height[left[node]]
+            h_right = height[right[node]]
+            new_height = 1 + (h_left if h_left > h_right else h_right)
+            if new_height == height[node]:
+                break
+            height[node] = new_height
+
+    def _new_node(self, key):
+        """
+        Take a slot from the free-list (or append one) and initialise it as a leaf.
+        """
+
+        node = self.free
+        if node != NIL:
+            self.free = self.left[node]
+            self.val[node] = key
+            self.left[node] = NIL
+            self.right[node] = NIL
+            self.height[node] = 1
+            return node
+
+        self.val.append(key)
+        self.left.append(NIL)
+        self.right.append(NIL)
+        self.height.append(1)
+        return len(self.val) - 1
+
+    def _free_node(self, node):
+        """
+        Push the slot of a deleted node onto the free-list.
+        """
+
+        self.val[node] = None
+        self.left[node] = self.free
+        self.free = node
+
 """
 Driver program to test above functions
 The constructed AVL Tree would be:
@@ -178,4 +761,16 @@ Inorder traversal result would be
 #     myTree.in_order(root)
 
 
+"""
+Sorted input builds a degenerate tree (a chain of 100000 nodes).
+insert, lookup and delete are iterative, so this no longer raises RecursionError.
+"""
+# myTree = BST()
+# root = None
+# for num in range(100000):
+#     root = myTree.insert(root, num)
+# print(myTree.lookup(root, 99999).val)
+# root = myTree.delete(root, 0)
+
+
 # This code is contributed by Sammy Wen.
\ No newline at end of file
@@ -0,0 +1,266 @@
+"""
+Python code to put a bounded LRU cache of lookups in front of the trees of this repo
+"""
+import bisect
+from collections import OrderedDict, namedtuple
+
+from avl_tree import AVLtree, PersistentAVLtree
+from b_tree import BTree
+from binary_search_tree import BST
+from red_black_tree import RBTree, TopDownRBTree
+
+
+CacheInfo = namedtuple('CacheInfo', ('hits', 'misses', 'maxsize', 'currsize'))
+
+
+class CachedTree:
+    """
+    A tree with an LRU cache of its lookups in front: a hot key is found with a dict access
+    instead of a descent from the root. lookup (or search, for a BTree) returns the node,
+    or None, like the tree does, and missing keys are cached too.
+
+    The cache holds at most maxsize keys, the least recently used one is evicted first;
+    cache_info() returns the hits, misses, maxsize and current size, like functools.lru_cache.
+
+    Invalidation:
+    - insert(key) drops key (it may be cached as missing).
+    - delete(key) drops key, and the keys just before and after it: deleting a node with
+      two children moves the key of its in-order predecessor (RBTree, TopDownRBTree) or
+      successor (AVLtree, BST) into it, and unlinks the node which held that key.
+      Rotations move nodes, never keys, so a cached node stays valid.
+    - A BTree moves keys between nodes (split, merge, borrow from a sibling), so a cached
+      node is checked to still hold the key on every hit (a bisect of node.keys); _merge
+      empties the node it unlinks, so the check cannot pass on a node out of the tree.
+    - A PersistentAVLtree copies the path to every updated node, so every update clears
+      the cache.
+    - insert_many and delete_many clear the cache.
+
+    The trees which take the root as a parameter (BST, AVLtree) have their root kept here,
+    as in ConcurrentTree: myTree.insert(key) instead of root = tree.insert(root, key).
+    Other read methods (range, rank, iter_in_order, ...) are passed to the tree.
+    """
+
+    READ_METHODS = frozenset((
+        'get', 'items', 'range', 'floor', 'ceiling', 'predecessor', 'successor', 'rank', 'select',
+        'count_range', 'size', 'in_order', 'pre_order', 'post_order', 'level_order', 'traverse',
+        'iter_in_order', 'iter_reverse_order', 'iter_pre_order', 'iter_post_order',
+        'iter_level_order', 'iter_levels'))
+    UPDATE_METHODS = frozenset(('insert_many', 'delete_many'))
+
+    def __init__(self, tree, maxsize=1024, root=None):
+        if not isinstance(tree, (BST, AVLtree, RBTree, TopDownRBTree, BTree)):
+            raise TypeError(f'CachedTree cannot cache a {type(tree).__name__}')
+        if maxsize < 1:
+            raise ValueError('The maxsize of the cache must be positive')
+        self.tree = tree
+        self.maxsize = maxsize
+        self.holds_root = isinstance(tree, (BST, AVLtree))
+        self.root = root
+        self.hits = 0
+        self.misses = 0
+        self._cache = OrderedDict()
+        self._multiway = isinstance(tree, BTree)
+        self._persistent = isinstance(tree, PersistentAVLtree)
+        self._null_leaves = isinstance(tree, RBTree)
+
+    def __getattr__(self, name):
+        if name not in self.READ_METHODS and name not in self.UPDATE_METHODS:
+            raise AttributeError(f'{type(self).__name__} does not support {name!r}')
+        method = getattr(self.tree, name)
+        update = name in self.UPDATE_METHODS
+
+        def delegated(*args, **kwargs):
+            if update:
+                self._cache.clear()
+            if not self.holds_root:
+                return method(*args, **kwargs)
+            if update:
+                self.root = method(self.root, *args, **kwargs)
+                return None
+            return method(self.root, *args, **kwargs)
+
+        return delegated
+
+    def __len__(self):
+        if self.holds_root:
+            return sum(1 for _ in self.tree.iter_in_order(self.root))
+        return len(self.tree)
+
+    def __contains__(self, key):
+        return self.lookup(key) is not None
+
+    def __iter__(self):
+        if self.holds_root:
+            return self.tree.iter_in_order(self.root)
+        return iter(self.tree)
+
+    def lookup(self, key):
+        """
+        Return the node holding key, or None, from the cache if possible.
+        """
+
+        cache = self._cache
+        if key in cache:
+            node = cache[key]
+            if not self._multiway or node is None or _holds(node, key):
+                cache.move_to_end(key)
+                self.hits += 1
+                return node
+
+        self.misses += 1
+        node = self._find(key)
+        cache[key] = node
+        cache.move_to_end(key)  # A stale BTree entry is refreshed in place
+        if len(cache) > self.maxsize:
+            cache.popitem(last=False)
+        return node
+
+    search = lookup
+
+    def insert(self, *args):
+        """
+        Insert a key (a key and its value for a BPlusTree), with the arguments of the tree's insert.
+        """
+
+        key = args[0]
+        if self._persistent:
+            self._cache.clear()
+        else:
+            self._cache.pop(key, None)
+        if self.holds_root:
+            self.root = self.tree.insert(self.root, *args)
+            return None
+        return self.tree.insert(*args)
+
+    def delete(self, key):
+        cache = self._cache
+        if self._persistent:
+            cache.clear()
+        elif not self._multiway:
+            for moved in self._neighbour_keys(key):
+                cache.pop(moved, None)
+        cache.pop(key, None)
+
+        if self.holds_root:
+            self.root = self.tree.delete(self.root, key)
+            return None
+        return self.tree.delete(key)
+
+    def cache_info(self):
+        return CacheInfo(self.hits, self.misses, self.maxsize, len(self._cache))
+
+    def cache_clear(self):
+        """
+        Empty the cache and reset its statistics.
+        """
+
+        self._cache.clear()
+        self.hits = self.misses = 0
+
+    def _find(self, key):
+        if self.holds_root:
+            return self.tree.lookup(self.root, key)
+        if self._multiway:
+            return self.tree.search(key)
+        return self.tree.lookup(key)
+
+    def _neighbour_keys(self, key):
+        """
+        Return the keys just before and just after key in a binary tree, if key is in it.
+        The neighbours are found by key order, not in the subtrees of the node of key,
+        because a TopDownRBTree rotates that node on its way down before the swap.
+        """
+
+        null_leaves = self._null_leaves
+        node = self.root if self.holds_root else self.tree.root
+        below = above = None
+        while node is not None and not (null_leaves and node.is_null_leaf):
+            if key < node.val:
+                above = node
+                node = node.left
+            elif key > node.val:
+                below = node
+                node = node.right
+            else:
+                break
+        else:
+            return ()
+
+        child = node.left
+        while child is not None and not (null_leaves and child.is_null_leaf):
+            below = child
+            child = child.right
+        child = node.right
+        while child is not None and not (null_leaves and child.is_null_leaf):
+            above = child
+            child = child.left
+        return tuple(neighbour.val for neighbour in (below, above) if neighbour is not None)
+
+
+def _holds(node, key):
+    """
+    Check that the BTree node still holds key.
+    """
+
+    keys = node.keys
+    i = bisect.bisect_left(keys, key)
+    return i < len(keys) and keys[i] == key
+
+
+"""
+Driver program to test above class.
+"""
+# myTree = CachedTree(RBTree(), maxsize=2)
+# for key in (5, 3, 8, 1):
+#     myTree.insert(key)
+# myTree.lookup(3)
+# myTree.lookup(3)
+# myTree.lookup(4)
+# myTree.delete(3)
+# print(myTree.lookup(3), myTree.cache_info())
+# # None CacheInfo(hits=1, misses=3, maxsize=2, currsize=2)
+#
+# # A stale BTree hit becomes the most recently used key
+# myTree = CachedTree(BTree(4), maxsize=2)
+# for key in (10, 20, 30):
+#     myTree.insert(key)
+# myTree.lookup(20)
+# myTree.lookup(10)
+# myTree.insert(40)  # Splits the root leaf: 20 moves up into a new root
+# myTree.lookup(20)  # Stale: found again, and moved to the end
+# myTree.lookup(30)  # Evicts 10
+# print(list(myTree._cache))  # [20, 30]
+
+
+"""
+Zipfian benchmark: 200000 lookups of keys drawn with a Zipf law of exponent s (hot keys
+scattered over the key space) in a tree of 1000000 string keys ('user:000012345'),
+time per lookup (best of 3, CPython 3.11), and hit rate of a cache of 1024 or 16384 keys:
+                  uncached   maxsize=1024       maxsize=16384
+    s=0.8 AVLtree  7.45 us   8.67 us  10% hits   9.16 us  27% hits
+          RBTree   5.13 us   6.16 us             6.27 us
+          BTree    4.58 us   6.64 us             6.85 us
+    s=1.0 AVLtree  6.35 us   7.32 us  41% hits   5.25 us  62% hits
+          RBTree   4.47 us   4.68 us             3.52 us
+          BTree    3.63 us   5.97 us             4.85 us
+    s=1.2 AVLtree  4.32 us   3.43 us  76% hits   1.65 us  89% hits
+          RBTree   3.33 us   2.25 us             1.57 us
+          BTree    2.36 us   2.24 us             1.96 us
+RBTree is the compact one, BTree has m=64. A hit costs about 0.15 us, a miss adds the
+insertion and the eviction to the descent, so the cache pays off from about 60% hits,
+and more when keys are slow to compare or the tree is deep (with 100000 int keys, s=1.2
+and maxsize=16384: AVLtree 1.91 -> 1.01 us, RBTree 1.35 -> 0.90 us, BTree 0.96 -> 1.18 us).
+The BTree gains the least: its descent is only 3 to 4 bisects in C.
+"""
+# import random
+# import timeit
+# from itertools import accumulate
+# N, L, S = 1000000, 200000, 1.2
+# keys = [f'user:{key:09d}' for key in random.sample(range(10 ** 8), N)]
+# hot = random.sample(keys, N)
+# lookups = random.choices(hot, cum_weights=list(accumulate(1 / r ** S for r in range(1, N + 1))), k=L)
+# myTree = RBTree(compact=True)
+# for key in keys:
+#     myTree.insert(key)
+# for find in (myTree.lookup, CachedTree(myTree, maxsize=1024).lookup, CachedTree(myTree, maxsize=16384).lookup):
+#     print(f'{min(timeit.repeat(lambda: [find(key) for key in lookups], number=1, repeat=3)) / L * 1e6:.2f} us')
@@ -1,7 +1,14 @@
 """
 Python code to implement functions for a Red-Black-Tree
 """
+import bisect
+from collections import deque
 from enum import Enum
+
+from tree_utils import (BATCH_REBUILD_RATIO, check_option, merge_batch, reject_duplicates,
+                        reject_missing, sorted_keys, subtract_batch)
+
+
 class NodeColor(Enum):
     """
     For defining an RBTreeNode's color.
@@ -10,38 +17,130 @@ class NodeColor(Enum):
     BLACK = 2
 
 
-class NullLeaf:
+class ColorBit:
+    """
+    Base class of the nodes: the color is stored as the bool node.red, which the hot paths
+    test directly, and node.color reads or sets it as a NodeColor (for printing and debugging).
+    """
+    __slots__ = ()
+
+    @property
+    def color(self):
+        return NodeColor.RED if self.red else NodeColor.BLACK
+
+    @color.setter
+    def color(self, color):
+        self.red = color is NodeColor.RED
+
+
+class NullLeaf(ColorBit):
     """
     Data Structure of Red-Black-Tree NullLeaf Node.
     """
     def __init__(self, parent):
         self.val = None
-        self.color = NodeColor.BLACK
+        self.red = False
         self.left = None
         self.right = None
         self.parent = parent
         self.is_null_leaf = True
+        self.size = 0
 
 
-class RBTreeNode:
+class RBTreeNode(ColorBit):
     """
     Data Structure of Red-Black-Tree Node.
     """
     def __init__(self, val):
         self.val = val
-        self.color = NodeColor.RED
+        self.value = None  # Payload of the key, used by SortedMap.
+        self.red = True
         self.left = NullLeaf(self)
         self.right = NullLeaf(self)
         self.parent = None
         self.is_null_leaf = False
+        self.size = 1
+
+
+class CompactNullLeaf(ColorBit):
+    """
+    Data Structure of the shared NullLeaf (sentinel) of a compact Red-Black-Tree.
+
+    Only one instance exists per tree. Its parent is meaningless except right after
+    _link_parent_and_child, where delete uses it to start fixing the double black.
+    """
+    __slots__ = ('val', 'red', 'left', 'right', 'parent', 'is_null_leaf', 'size')
+
+    def __init__(self):
+        self.val = None
+        self.red = False
+        self.left = None
+        self.right = None
+        self.parent = None
+        self.is_null_leaf = True
+        self.size = 0
+
+
+class CompactRBTreeNode(ColorBit):
+    """
+    Data Structure of a compact Red-Black-Tree Node.
+    Both children point to the tree's shared CompactNullLeaf instead of fresh NullLeafs.
+    """
+    __slots__ = ('val', 'value', 'red', 'left', 'right', 'parent', 'is_null_leaf', 'size')
+
+    def __init__(self, val, nil):
+        self.val = val
+        self.value = None
+        self.red = True
+        self.left = nil
+        self.right = nil
+        self.parent = None
+        self.is_null_leaf = False
+        self.size = 1
+
+
+class TopDownRBTreeNode(ColorBit):
+    """
+    Data Structure of a TopDownRBTree Node: no parent pointer, and None instead of NullLeafs.
+    """
+    __slots__ = ('val', 'value', 'red', 'left', 'right')
+
+    def __init__(self, val):
+        self.val = val
+        self.value = None
+        self.red = True
+        self.left = None
+        self.right = None
 
 
 class RBTree:
     """
     Red-Black-Tree class
+
+    With compact=True, nodes are __slots__ objects and every NullLeaf is one shared
+    sentinel, so a tree of N keys holds about N objects instead of 3N.
+
+    With order_statistic=True, every node also keeps the size of its subtree,
+    which enables rank, select, count_range and len() in O(log(n)).
     """
 
-    root = None
+    def __init__(self, compact=False, order_statistic=False):
+        self.root = None
+        self.compact = compact
+        self.order_statistic = order_statistic
+        self.nil = CompactNullLeaf() if compact else None
+        self.stats = None  # TreeStats recording rotations, recolorings and delete cases
+
+    def __len__(self):
+        """
+        O(1) in order_statistic mode, otherwise the keys are counted.
+        """
+
+        if self.root is None:
+            return 0
+        if self.order_statistic:
+            return self.root.size
+        return sum(1 for _ in self.iter_in_order())
 
     @staticmethod
     def print_node(node):
@@ -62,40 +161,782 @@ class RBTree:
         Print Red-Black-Tree in inorder.
         """
 
+        for val in self.iter_in_order(node):
+            print(f'{val}')
+
+    def level_order(self):
+        """
+        Print Red-Black-Tree in levelorder.
+
+        levelorder: from root to leaf, from left to right if nodes are in the same level.
+        """
+
+        for val in self.iter_level_order():
+            print(f'{val}')
+
+    def __iter__(self):
+        return self.iter_in_order()
+
+    def __reversed__(self):
+        return self.iter_reverse_order()
+
+    def iter_in_order(self, node=False):
+        """
+        Generator yielding the keys in inorder (ascending).
+        Iterative, the stack holds one path of the tree.
+        """
+
         if node is False:
             node = self.root
+        if node is None:
+            return
 
-        if self.root is None or node.is_null_leaf:
+        stack = []
+        while stack or not node.is_null_leaf:
+            while not node.is_null_leaf:
+                stack.append(node)
+                node = node.left
+            node = stack.pop()
+            yield node.val
+            node = node.right
+
+    def iter_reverse_order(self, node=False):
+        """
+        Generator yielding the keys in reverse inorder (descending).
+        """
+
+        if node is False:
+            node = self.root
+        if node is None:
             return
 
-        self.in_order(node.left)
-        print(f'{node.val}')
-        self.in_order(node.right)
+        stack = []
+        while stack or not node.is_null_leaf:
+            while not node.is_null_leaf:
+                stack.append(node)
+                node = node.right
+            node = stack.pop()
+            yield node.val
+            node = node.left
 
-    def level_order(self):
+    def iter_pre_order(self, node=False):
+        """
+        Generator yielding the keys in preorder.
         """
-        Print Red-Black-Tree in levelorder.
 
-        levelorder: from root to leaf, from left to right if nodes are in the same level.
+        if node is False:
+            node = self.root
+        if node is None or node.is_null_leaf:
+            return
+
+        stack = [node]
+        while stack:
+            node = stack.pop()
+            yield node.val
+            if not node.right.is_null_leaf:
+                stack.append(node.right)
+            if not node.left.is_null_leaf:
+                stack.append(node.left)
+
+    def iter_post_order(self, node=False):
+        """
+        Generator yielding the keys in postorder.
+        A node is yielded once its right subtree (the last one visited) is done.
+        """
+
+        if node is False:
+            node = self.root
+        if node is None:
+            return
+
+        stack = []
+        last = None
+        while stack or not node.is_null_leaf:
+            if not node.is_null_leaf:
+                stack.append(node)
+                node = node.left
+                continue
+            top = stack[-1]
+            if not top.right.is_null_leaf and top.right is not last:
+                node = top.right
+            else:
+                yield top.val
+                last = stack.pop()
+
+    def iter_level_order(self):
+        """
+        Generator yielding the keys in levelorder.
+        The queue is a deque, so every step is O(1).
         """
 
         if self.root is None:
             return
 
-        queue = [self.root]
+        queue = deque([self.root])
         while queue:
-            cur = queue.pop(0)
-            print(f'{cur.val}')
+            cur = queue.popleft()
+            yield cur.val
             if not cur.left.is_null_leaf:
                 queue.append(cur.left)
             if not cur.right.is_null_leaf:
                 queue.append(cur.right)
 
+    def iter_levels(self):
+        """
+        Generator yielding (depth, key) in levelorder, depth 0 being the root.
+        Each level is a list scanned while the next one is built,
+        so at most two levels are held at a time.
+        """
+
+        level = [self.root] if self.root is not None else []
+        depth = 0
+        while level:
+            next_level = []
+            for node in level:
+                yield depth, node.val
+                if not node.left.is_null_leaf:
+                    next_level.append(node.left)
+                if not node.right.is_null_leaf:
+                    next_level.append(node.right)
+            level = next_level
+            depth += 1
+
+    def range(self, lo=None, hi=None, inclusive=(True, True)):
+        """
+        Generator yielding, in ascending order, the keys between lo and hi.
+        lo/hi: None means unbounded on that side.
+        inclusive: pair of booleans telling whether lo and hi themselves are included.
+        Cost is O(log(n) + k): one descent to the first key, then an inorder walk.
+        """
+
+        if self.root is None:
+            return
+        lo_inclusive, hi_inclusive = inclusive
+
+        # Descend to the first key in range, keeping the nodes still to be visited
+        stack = []
+        node = self.root
+        while not node.is_null_leaf:
+            if lo is None or lo < node.val or (lo_inclusive and lo == node.val):
+                stack.append(node)
+                node = node.left
+            else:
+                node = node.right
+
+        # Inorder walk from there until a key passes hi
+        while stack:
+            node = stack.pop()
+            if hi is not None and (hi < node.val or (not hi_inclusive and hi == node.val)):
+                return
+            yield node.val
+            node = node.right
+            while not node.is_null_leaf:
+                stack.append(node)
+                node = node.left
+
+    def floor(self, key):
+        """
+        Return the largest key less than or equal to the given key, or None.
+        """
+
+        return self._closest_below(key, True)
+
+    def ceiling(self, key):
+        """
+        Return the smallest key greater than or equal to the given key, or None.
+        """
+
+        return self._closest_above(key, True)
+
+    def predecessor(self, key):
+        """
+        Return the largest key strictly less than the given key, or None.
+        """
+
+        return self._closest_below(key, False)
+
+    def successor(self, key):
+        """
+        Return the smallest key strictly greater than the given key, or None.
+        """
+
+        return self._closest_above(key, False)
+
+    def _closest_below(self, key, inclusive):
+        """
+        Descend from the root, remembering the last key which is below (or equal to) key.
+        """
+
+        if self.root is None:
+            return None
+
+        ret = None
+        node = self.root
+        while not node.is_null_leaf:
+            if node.val < key or (inclusive and node.val == key):
+                ret = node.val
+                node = node.right
+            else:
+                node = node.left
+        return ret
+
+    def _closest_above(self, key, inclusive):
+        """
+        Descend from the root, remembering the last key which is above (or equal to) key.
+        """
+
+        if self.root is None:
+            return None
+
+        ret = None
+        node = self.root
+        while not node.is_null_leaf:
+            if key < node.val or (inclusive and node.val == key):
+                ret = node.val
+                node = node.left
+            else:
+                node = node.right
+        return ret
+
+    def rank(self, key):
+        """
+        Return the number of keys strictly less than key (needs order_statistic=True).
+        """
+
+        self._check_order_statistic()
+        return self._count_below(key, False)
+
+    def select(self, k):
+        """
+        Return the k-th smallest key, counting from 0 (needs order_statistic=True).
+        Raise IndexError if k is out of range.
+        """
+
+        self._check_order_statistic()
+        if not 0 <= k < len(self):
+            raise IndexError('select index out of range')
+
+        node = self.root
+        while True:
+            left_size = node.left.size
+            if k < left_size:
+                node = node.left
+            elif k == left_size:
+                return node.val
+            else:
+                k -= left_size + 1
+                node = node.right
+
+    def count_range(self, lo, hi, inclusive=(True, True)):
+        """
+        Return the number of keys between lo and hi (needs order_statistic=True).
+        inclusive: pair of booleans telling whether lo and hi themselves are counted.
+        """
+
+        self._check_order_statistic()
+        lo_inclusive, hi_inclusive = inclusive
+        count = self._count_below(hi, hi_inclusive) - self._count_below(lo, not lo_inclusive)
+        return max(count, 0)
+
+    def _count_below(self, key, inclusive):
+        """
+        Return the number of keys less than key (or equal to it, if inclusive).
+        """
+
+        if self.root is None:
+            return 0
+
+        count = 0
+        node = self.root
+        while not node.is_null_leaf:
+            if node.val < key or (inclusive and node.val == key):
+                count += 1 + node.left.size
+                node = node.right
+            else:
+                node = node.left
+        return count
+
+    def _check_order_statistic(self):
+        """
+        Subtree sizes are only kept up to date in order_statistic mode.
+        """
+
+        if not self.order_statistic:
+            raise ValueError('This operation needs an RBTree(order_statistic=True)')
+
+    @classmethod
+    def from_sorted(cls, iterable, sort=False, dedupe=False, **kwargs):
+        """
+        Build a Red-Black-Tree from keys in ascending order in O(n), without any rotation.
+        The middle key of every range becomes the subtree root, so all NullLeafs sit on
+        the last two levels: nodes on the deepest level are RED, all others are BLACK.
+        sort: sort the keys first instead of requiring sorted input.
+        dedupe: keep only one copy of repeated keys (otherwise they raise ValueError).
+        Other keyword arguments are passed to the constructor (e.g. compact=True).
+        """
+
+        keys = sorted_keys(iterable, sort, dedupe)
+        for i in range(1, len(keys)):
+            if keys[i] == keys[i - 1]:
+                raise ValueError(f'Duplicate key {keys[i]!r}, pass dedupe=True to drop it')
+
+        tree = cls(**kwargs)
+        tree.root = tree._link_sorted([tree._new_node(key) for key in keys])
+        return tree
+
+    def _link_sorted(self, nodes):
+        """
+        Link the nodes (in key order, with unique keys) into a tree colored like
+        from_sorted and return its root (or None).
+        """
+
+        if not nodes:
+            return None
+
+        red_depth = len(nodes).bit_length() - 1
+        root = self._link_balanced(nodes, 0, len(nodes), 0, red_depth)
+        root.parent = None
+        root.red = False
+        return root
+
+    def _link_balanced(self, nodes, lo, hi, depth, red_depth):
+        """
+        Link nodes[lo:hi] into the subtree at the given depth and return its root
+        (recursion depth is log(n)).
+        """
+
+        mid = (lo + hi) // 2
+        node = nodes[mid]
+        node.size = hi - lo
+        node.red = depth == red_depth
+        if lo < mid:
+            node.left = self._link_balanced(nodes, lo, mid, depth + 1, red_depth)
+            node.left.parent = node
+        elif not node.left.is_null_leaf:
+            node.left = self._new_null_leaf(node)
+        if mid + 1 < hi:
+            node.right = self._link_balanced(nodes, mid + 1, hi, depth + 1, red_depth)
+            node.right.parent = node
+        elif not node.right.is_null_leaf:
+            node.right = self._new_null_leaf(node)
+        return node
+
+    def insert_many(self, keys, on_duplicate='skip'):
+        """
+        Insert a batch of keys and return the number of keys inserted.
+
+        The batch is sorted first. If the tree holds at most BATCH_REBUILD_RATIO times as
+        many keys as the batch, its nodes and the new ones are merged in key order and
+        relinked into a tree colored like from_sorted in O(n + k), without any rotation.
+        Otherwise the batch is merged by a split/join union in O(k log(n/k + 1)):
+        the batch is split at the key of the root, each part goes into its subtree in the
+        same way, and the two subtrees are joined back with the root. A subtree which gets
+        no key is kept as it is, and a part which falls in an empty subtree is linked as it is.
+        on_duplicate: the keys of a Red-Black-Tree are unique, so a key already in the tree
+            or repeated in the batch is either ignored ('skip', like insert)
+            or raises KeyError before the tree is modified ('error').
+        """
+
+        check_option('on_duplicate', on_duplicate, ('skip', 'error'))
+        batch = sorted(keys)
+        nodes = self._collect_nodes(len(batch) * BATCH_REBUILD_RATIO)
+        if nodes is not None:
+            merged = merge_batch(nodes, batch, on_duplicate, self._new_node)
+            self.root = self._link_sorted(merged)
+            return len(merged) - len(nodes)
+
+        if on_duplicate == 'error':
+            reject_duplicates(batch, lambda key: self.lookup(key) is not None)
+        else:
+            batch = [key for i, key in enumerate(batch) if i == 0 or batch[i - 1] != key]
+        self.root, _, inserted = self._union(self.root, self._black_height(self.root), batch, 0, len(batch))
+        return inserted
+
+    def delete_many(self, keys, on_missing='ignore'):
+        """
+        Delete a batch of keys and return the number of keys deleted.
+        Same strategy as insert_many: relink the remaining nodes, or split the batch at the
+        key of the root, delete each part from its subtree, and join them back with the root,
+        or with the smallest node of the right subtree if the root is deleted.
+        on_missing: 'ignore' skips a key which is not in the tree (or repeated in the batch),
+            'error' raises KeyError before the tree is modified.
+        """
+
+        check_option('on_missing', on_missing, ('ignore', 'error'))
+        batch = sorted(keys)
+        nodes = self._collect_nodes(len(batch) * BATCH_REBUILD_RATIO)
+        if nodes is not None:
+            remaining = subtract_batch(nodes, batch, on_missing)
+            self.root = self._link_sorted(remaining)
+            return len(nodes) - len(remaining)
+
+        if on_missing == 'error':
+            reject_missing(batch, lambda key, limit: 0 if self.lookup(key) is None else 1)
+        batch = [key for i, key in enumerate(batch) if i == 0 or batch[i - 1] != key]
+        self.root, _, deleted = self._difference(self.root, self._black_height(self.root), batch, 0, len(batch))
+        return deleted
+
+    def _union(self, root, height, batch, lo, hi):
+        """
+        Insert the sorted, unique keys batch[lo:hi] into the subtree root (None or a NullLeaf
+        when empty) of the given black height. Return its new root, its black height and
+        the number of keys inserted.
+        """
+
+        if lo == hi:
+            return root, height, 0
+        if root is None or root.is_null_leaf:
+            root = self._link_sorted([self._new_node(key) for key in batch[lo:hi]])
+            return root, self._black_height(root), hi - lo
+        if hi - lo == 1:
+            return self._update_alone(root, height, batch[lo], True)
+
+        key = root.val
+        child_height = height - 1 if not root.red else height
+        mid = bisect.bisect_left(batch, key, lo, hi)
+        left, left_height, inserted = root.left, child_height, 0
+        if lo < mid:
+            left, left_height, inserted = self._union(left, left_height, batch, lo, mid)
+        if mid < hi and batch[mid] == key:
+            mid += 1
+        right, right_height = root.right, child_height
+        if mid < hi:
+            right, right_height, right_inserted = self._union(right, right_height, batch, mid, hi)
+            inserted += right_inserted
+        root, height = self._rejoin(left, left_height, root, height, right, right_height)
+        return root, height, inserted
+
+    def _difference(self, root, height, batch, lo, hi):
+        """
+        Delete the sorted, unique keys batch[lo:hi] from the subtree root of the given
+        black height. Return its new root, its black height and the number of keys deleted.
+        """
+
+        if lo == hi or root is None or root.is_null_leaf:
+            return root, height, 0
+        if hi - lo == 1:
+            return self._update_alone(root, height, batch[lo], False)
+
+        key = root.val
+        child_height = height - 1 if not root.red else height
+        first = last = bisect.bisect_left(batch, key, lo, hi)
+        if last < hi and batch[last] == key:
+            last += 1
+        left, left_height, deleted = root.left, child_height, last - first
+        if lo < first:
+            left, left_height, left_deleted = self._difference(left, left_height, batch, lo, first)
+            deleted += left_deleted
+        right, right_height = root.right, child_height
+        if last < hi:
+            right, right_height, right_deleted = self._difference(right, right_height, batch, last, hi)
+            deleted += right_deleted
+        if first == last:
+            root, height = self._rejoin(left, left_height, root, height, right, right_height)
+            return root, height, deleted
+
+        # Join the two subtrees with the smallest node of right in between
+        smallest = self._extreme_node(right, 'left')
+        if smallest is None:
+            root, height = self._as_root(left, left_height)
+            return root, height, deleted
+        _, _, smallest, right, right_height = self._split_at(right, right_height, smallest.val)
+        root, height = self._join_roots(left, left_height, smallest, right, right_height)
+        return root, height, deleted
+
+    def _update_alone(self, root, height, key, insert):
+        """
+        Insert (or delete) a single key in the subtree root of the given black height, as a
+        tree of its own: self.root is used as scratch space, as in _join_roots.
+        Return its new root, its black height and 1 if key was inserted (or deleted), else 0.
+        """
+
+        self.root, height = self._as_root(root, height)
+        if insert:
+            updated = self._insert_node(key)[1]
+        else:
+            node = self.lookup(key)
+            updated = node is not None
+            if updated:
+                self._delete_node(node)
+        root = self.root
+        return root, self._black_height(root), int(updated)
+
+    def _rejoin(self, left, left_height, node, height, right, right_height):
+        """
+        Put node (of black height height) back between its subtrees, rebuilt into left and
+        right by _union or _difference. Return the root and its black height.
+        If both kept their black height and no RED node gets a RED child, only the links
+        are set; otherwise they are joined with _join_roots.
+        """
+
+        child_height = height - 1 if not node.red else height
+        if left_height == right_height == child_height and \
+                not (node.red and ((left is not None and left.red) or (right is not None and right.red))):
+            self._set_children(node, left, right)
+            return node, height
+        return self._join_roots(left, left_height, node, right, right_height)
+
+    def _collect_nodes(self, limit):
+        """
+        Return the list of nodes in key order, or None if there are more than limit.
+        """
+
+        if self.root is None:
+            return []
+        if self.order_statistic and self.root.size > limit:
+            return None
+        # A tree of black height h holds at least 2 ** h - 1 nodes
+        if (1 << self._black_height(self.root)) - 1 > limit:
+            return None
+
+        nodes = []
+        stack = []
+        node = self.root
+        while stack or not node.is_null_leaf:
+            while not node.is_null_leaf:
+                stack.append(node)
+                node = node.left
+            node = stack.pop()
+            nodes.append(node)
+            if len(nodes) > limit:
+                return None
+            node = node.right
+        return nodes
+
+    def split(self, key):
+        """
+        Split the tree into two new trees, holding the keys < key and the keys >= key,
+        in O(log(n)). The nodes move to the new trees, so this tree is left empty.
+        Every node on the path to key is joined back, bottom-up, to the side it belongs to.
+        The trees joined on each side only grow, so the joins cost O(log(n)) in total.
+        """
+
+        left_tree = self._empty_copy()
+        right_tree = self._empty_copy()
+
+        # Keep the black height of every node on the path to key
+        path = []
+        node = self.root
+        height = self._black_height(node)
+        while node is not None and not node.is_null_leaf:
+            path.append((node, height))
+            if not node.red:
+                height -= 1
+            node = node.left if key <= node.val else node.right
+
+        left = right = None
+        left_height = right_height = 0
+        for node, height in reversed(path):
+            child_height = height - 1 if not node.red else height
+            if key <= node.val:
+                right, right_height = self._join_roots(right, right_height, node, node.right, child_height)
+            else:
+                left, left_height = self._join_roots(node.left, child_height, node, left, left_height)
+
+        self.root = None
+        left_tree.root = left
+        right_tree.root = right
+        return left_tree, right_tree
+
+    def _split_at(self, root, height, key):
+        """
+        Split the subtree root of the given black height like split, but take out the node
+        holding key on the way down. Return (left, its black height, node, right, its black
+        height), with node None if key is not in the subtree.
+        """
+
+        path = []
+        node = root
+        while node is not None and not node.is_null_leaf and key != node.val:
+            path.append((node, height))
+            if not node.red:
+                height -= 1
+            node = node.left if key < node.val else node.right
+
+        left = right = None
+        left_height = right_height = 0
+        if node is not None and not node.is_null_leaf:
+            child_height = height - 1 if not node.red else height
+            left, left_height = self._as_root(node.left, child_height)
+            right, right_height = self._as_root(node.right, child_height)
+        else:
+            node = None
+        for parent, height in reversed(path):
+            child_height = height - 1 if not parent.red else height
+            if key < parent.val:
+                right, right_height = self._join_roots(right, right_height, parent, parent.right, child_height)
+            else:
+                left, left_height = self._join_roots(parent.left, child_height, parent, left, left_height)
+        return left, left_height, node, right, right_height
+
+    @classmethod
+    def join(cls, left, *args):
+        """
+        join(left, right) or join(left, key, right)
+        Return a new tree holding the keys of the trees left and right (and key), in O(log(n)).
+        Every key of left must be < key (or the smallest key of right) < every key of right,
+        otherwise ValueError is raised. Without key, the smallest node of right is moved
+        in between. The nodes move to the new tree, so left and right are left empty.
+        """
+
+        if len(args) == 2:
+            key, right = args
+        elif len(args) == 1:
+            right = args[0]
+        else:
+            raise TypeError('join() takes a left tree, an optional key and a right tree')
+        if (left.compact, left.order_statistic) != (right.compact, right.order_statistic):
+            raise ValueError('join() needs trees with the same compact and order_statistic settings')
+
+        largest = left._extreme_node(left.root, 'right')
+        smallest = right._extreme_node(right.root, 'left')
+        if len(args) == 1:
+            if smallest is None:
+                tree = left._empty_copy()
+                tree.root, left.root = left.root, None
+                return tree
+            key = smallest.val
+        if (largest is not None and not largest.val < key) or \
+                (smallest is not None and len(args) == 2 and not key < smallest.val):
+            raise ValueError('join() needs every key of left < key < every key of right')
+
+        tree = left._empty_copy()
+        if len(args) == 2:
+            node = tree._new_node(key)
+        else:
+            node = smallest
+            right._delete_node(node)
+        tree.root = tree._join_roots(left.root, cls._black_height(left.root),
+                                     node, right.root, cls._black_height(right.root))[0]
+        left.root = right.root = None
+        return tree
+
+    def _join_roots(self, left, left_height, node, right, right_height):
+        """
+        Join the subtrees left and right (of the given black heights) with node in between.
+        Return the root of the result and its black height.
+
+        If the black heights differ, walk down the inner spine of the taller subtree to a
+        BLACK node of the same black height as the other one, and put node (RED) in its place
+        with both subtrees of equal black height under it. Only a RED-RED violation
+        with its parent is possible then, which _fix_insert_violation repairs.
+        (self.root is used as scratch space for the rotations.)
+        """
+
+        left, left_height = self._as_root(left, left_height)
+        right, right_height = self._as_root(right, right_height)
+
+        if left_height == right_height:
+            self._set_children(node, left, right)
+            node.parent = None
+            node.red = False
+            return node, left_height + 1
+
+        parent = None
+        if left_height > right_height:
+            root, height = left, left_height
+            cur, cur_height = left, left_height
+            while cur.red or cur_height > right_height:
+                if not cur.red:
+                    cur_height -= 1
+                parent, cur = cur, cur.right
+            self._set_children(node, cur, right)
+            parent.right = node
+        else:
+            root, height = right, right_height
+            cur, cur_height = right, right_height
+            while cur.red or cur_height > left_height:
+                if not cur.red:
+                    cur_height -= 1
+                parent, cur = cur, cur.left
+            self._set_children(node, left, cur)
+            parent.left = node
+        node.parent = parent
+        node.red = True
+
+        if self.order_statistic:
+            added = node.size - cur.size
+            ancestor = parent
+            while ancestor is not None:
+                ancestor.size += added
+                ancestor = ancestor.parent
+
+        self.root = root
+        self._fix_insert_violation(node)
+        root = self.root
+        if root.red:
+            root.red = False
+            height += 1
+        return root, height
+
+    @staticmethod
+    def _as_root(node, height):
+        """
+        Make a subtree (or a NullLeaf) a tree of its own: detach it from its parent and
+        paint it BLACK. Return the root (None for an empty tree) and its black height.
+        """
+
+        if node is None or node.is_null_leaf:
+            return None, 0
+        node.parent = None
+        if node.red:
+            node.red = False
+            height += 1
+        return node, height
+
+    def _set_children(self, node, left, right):
+        """
+        Make left and right (roots, NullLeafs or None) the children of node.
+        """
+
+        node.left = left if left is not None else self._new_null_leaf(node)
+        node.right = right if right is not None else self._new_null_leaf(node)
+        if not node.left.is_null_leaf:
+            node.left.parent = node
+        if not node.right.is_null_leaf:
+            node.right.parent = node
+        if self.order_statistic:
+            node.size = 1 + node.left.size + node.right.size
+
+    @staticmethod
+    def _black_height(node):
+        """
+        Return the number of BLACK nodes on the path from node down to a NullLeaf.
+        """
+
+        height = 0
+        while node is not None and not node.is_null_leaf:
+            if not node.red:
+                height += 1
+            node = node.left
+        return height
+
+    @staticmethod
+    def _extreme_node(node, side):
+        """
+        Return the node with the smallest (side='left') or largest (side='right') key, or None.
+        """
+
+        if node is None or node.is_null_leaf:
+            return None
+        while not getattr(node, side).is_null_leaf:
+            node = getattr(node, side)
+        return node
+
+    def _empty_copy(self):
+        """
+        Return an empty tree with the same settings (and the same compact NullLeaf).
+        """
+
+        tree = type(self)(compact=self.compact, order_statistic=self.order_statistic)
+        tree.nil = self.nil
+        return tree
+
     def lookup(self, key, node=False):
         """
         Identical to the implementation of AVL tree lookup.
 
-        Recursive function to lookup the node which has the same value as the given key.
+        Iterative function to lookup the node which has the same value as the given key.
         Return the node if it meets the requirement.
         Return None if the node isn't exist.
         """
@@ -103,14 +944,17 @@ class RBTree:
         if node is False:
             node = self.root
 
-        if self.root is None or node.is_null_leaf:
+        if self.root is None:
             return None
 
-        if key < node.val:
-            return self.lookup(key, node.left) if not node.left.is_null_leaf else None
-        if key > node.val:
-            return self.lookup(key, node.right) if not node.right.is_null_leaf else None
-        return node
+        while not node.is_null_leaf:
+            if key < node.val:
+                node = node.left
+            elif key > node.val:
+                node = node.right
+            else:
+                return node
+        return None
 
     def insert(self, key):
         """
@@ -120,26 +964,12 @@ class RBTree:
         X: Fill-in 'L' if g's left child is p, else fill-in 'R'.
         Y: Fill-in 'L' if p's left child is n, else fill-in 'R'.
         c: Fill-in 'b' if p's sibling (uncle (u)) is BLACK, else fill-in 'r'.
-        """
-
-        if self.root is None:
-            self.root = RBTreeNode(key)
-            self.root.color = NodeColor.BLACK
-            return
 
-        if self.lookup(key) is not None:
-            print('The key already exists in the tree.')
-            return
-
-        # Step 1 - Perform normal BST insert
-        new_node = RBTreeNode(key)
-        _ = self._bst_insert(new_node, self.root)
-
-        # Step 2 - Fix the violation after new_node inserted.
-        self._fix_insert_violation(new_node)
+        The descent which finds the place of the new node also detects an existing key.
+        Return True if key was inserted, False if it already exists in the tree.
+        """
 
-        # Step 3 - keep self.root BLACK
-        self.root.color = NodeColor.BLACK
+        return self._insert_node(key)[1]
 
     def delete(self, key):
         """
@@ -165,40 +995,98 @@ class RBTree:
             print('The key does not exist in the tree')
             return
 
+        self._delete_node(deleted_node)
+
+    def _delete_node(self, deleted_node):
+        """
+        Step 1 ~ Step 4 of delete, for a node already found in the tree.
+        """
+
         # Step 1
         if deleted_node.left.is_null_leaf or deleted_node.right.is_null_leaf:
             pass
         else:
             predecessor = self._get_predecessor(deleted_node)
             deleted_node.val = predecessor.val
+            deleted_node.value = predecessor.value
             deleted_node = predecessor
 
         # Step 2 & Step 3
         child = deleted_node.left if not deleted_node.left.is_null_leaf else deleted_node.right
         self._link_parent_and_child(deleted_node, child)
-        if deleted_node.color == NodeColor.RED or child.color == NodeColor.RED:
-            if child.color == NodeColor.RED:
-                child.color = NodeColor.BLACK
+        if self.order_statistic:
+            ancestor = child.parent
+            while ancestor is not None:
+                ancestor.size -= 1
+                ancestor = ancestor.parent
+        if deleted_node.red or child.red:
+            if child.red:
+                child.red = False
             return
 
         # Step 4
         self._delete_case_1(child)
 
-    def _bst_insert(self, new_node, node, parent=None):
+    def _insert_node(self, key):
         """
-        Recursive function to insert key in subtree rooted with node
-        and returns new root of subtree.
+        Insert key with a single iterative descent, which also detects an existing key.
+        Return (node, True) for the new node, or (node, False) if key was already there.
         """
 
-        if node.is_null_leaf:
-            new_node.parent = parent
-            return new_node
+        if self.root is None:
+            self.root = self._new_node(key)
+            self.root.red = False
+            return self.root, True
+
+        # Step 1 - Descend to the NullLeaf where key belongs
+        parent = self.root
+        while True:
+            parent_val = parent.val
+            if key < parent_val:
+                child = parent.left
+            elif key > parent_val:
+                child = parent.right
+            else:
+                return parent, False
+            if child.is_null_leaf:
+                break
+            parent = child
+
+        new_node = self._new_node(key)
+        new_node.parent = parent
+        if key < parent.val:
+            parent.left = new_node
+        else:
+            parent.right = new_node
 
-        if new_node.val < node.val:
-            node.left = self._bst_insert(new_node, node.left, node)
-        elif new_node.val > node.val:
-            node.right = self._bst_insert(new_node, node.right, node)
-        return node
+        if self.order_statistic:
+            ancestor = parent
+            while ancestor is not None:
+                ancestor.size += 1
+                ancestor = ancestor.parent
+
+        # Step 2 - Fix the violation after new_node inserted.
+        self._fix_insert_violation(new_node)
+
+        # Step 3 - keep self.root BLACK
+        self.root.red = False
+        return new_node, True
+
+    def _new_node(self, key):
+        """
+        Create a RED node with the layout selected by self.compact.
+        """
+
+        if self.compact:
+            return CompactRBTreeNode(key, self.nil)
+        return RBTreeNode(key)
+
+    def _new_null_leaf(self, parent):
+        """
+        Return a NullLeaf child for parent (the shared sentinel when compact).
+        """
+
+        return self.nil if self.compact else NullLeaf(parent)
 
     def _fix_insert_violation(self, node):
         """
@@ -206,7 +1094,7 @@ class RBTree:
         """
 
         if node == self.root or \
-            node.color == NodeColor.BLACK or node.parent.color == NodeColor.BLACK:
+            not node.red or not node.parent.red:
             return
 
         parent = node.parent
@@ -214,32 +1102,32 @@ class RBTree:
 
         if parent == grand_parent.left:
             uncle = grand_parent.right
-            if uncle.color == NodeColor.RED:
+            if uncle.red:
                 # [LLr, LRr], need to recolor.
                 self._insert_recolor(node)
             else:
                 # [LLb, LRb], need to rotate.
                 if node == parent.left:  # LLb
                     self._right_rotate(grand_parent)
-                    parent.color, grand_parent.color = grand_parent.color, parent.color
+                    parent.red, grand_parent.red = grand_parent.red, parent.red
                 else:  # LRb
                     self._left_rotate(parent)
                     self._right_rotate(grand_parent)
-                    node.color, grand_parent.color = grand_parent.color, node.color
+                    node.red, grand_parent.red = grand_parent.red, node.red
         else:
             uncle = grand_parent.left
-            if uncle.color == NodeColor.RED:
+            if uncle.red:
                 # [RRr, RLr], need to recolor.
                 self._insert_recolor(node)
             else:
                 # [RRb, RLb], need to rotate.
                 if node == parent.right:  # RRb
                     self._left_rotate(grand_parent)
-                    parent.color, grand_parent.color = grand_parent.color, parent.color
+                    parent.red, grand_parent.red = grand_parent.red, parent.red
                 else:  # RLb
                     self._right_rotate(parent)
                     self._left_rotate(grand_parent)
-                    node.color, grand_parent.color = grand_parent.color, node.color
+                    node.red, grand_parent.red = grand_parent.red, node.red
 
     def _insert_recolor(self, node):
         """
@@ -263,9 +1151,11 @@ class RBTree:
         grand_parent = node.parent.parent
         uncle = grand_parent.right if parent == grand_parent.left else grand_parent.left
 
-        grand_parent.color = NodeColor.RED
-        parent.color = NodeColor.BLACK
-        uncle.color = NodeColor.BLACK
+        if self.stats is not None:
+            self.stats.event('recolor')
+        grand_parent.red = True
+        parent.red = False
+        uncle.red = False
         self._fix_insert_violation(grand_parent)
 
     def _right_rotate(self, node):
@@ -290,6 +1180,9 @@ class RBTree:
         Step 3: Original left_child.right (T1) is the new node.left
         """
 
+        if self.stats is not None:
+            self.stats.event('rotate_right')
+
         # Check if the root would change after rotate
         if node == self.root:
             self.root = node.left
@@ -310,9 +1203,16 @@ class RBTree:
             else:
                 parent.right = left_child
 
-        T1.parent = node
+        # The shared NullLeaf of a compact tree must keep the parent set by
+        # _link_parent_and_child, so only real nodes are re-parented.
+        if not T1.is_null_leaf:
+            T1.parent = node
         node.left = T1
 
+        if self.order_statistic:
+            node.size = 1 + T1.size + node.right.size
+            left_child.size = 1 + left_child.left.size + node.size
+
     def _left_rotate(self, node):
         """
         Graph for RR case:
@@ -335,6 +1235,9 @@ class RBTree:
         Step 3: Original right_child.left (T3) is the new node.right
         """
 
+        if self.stats is not None:
+            self.stats.event('rotate_left')
+
         # Check if the root would change after rotate
         if node == self.root:
             self.root = node.right
@@ -355,9 +1258,14 @@ class RBTree:
             else:
                 parent.right = right_child
 
-        T3.parent = node
+        if not T3.is_null_leaf:
+            T3.parent = node
         node.right = T3
 
+        if self.order_statistic:
+            node.size = 1 + node.left.size + T3.size
+            right_child.size = 1 + node.size + right_child.right.size
+
     @staticmethod
     def _get_predecessor(node):
         """
@@ -397,7 +1305,9 @@ class RBTree:
         """
 
         if node == self.root:
-            if isinstance(node, NullLeaf):
+            if self.stats is not None:
+                self.stats.event('delete_case_1')
+            if node.is_null_leaf:
                 self.root = None
             return
         self._delete_case_2(node)
@@ -421,8 +1331,10 @@ class RBTree:
         parent = node.parent
         sibling = parent.right if node == parent.left else parent.left
 
-        if sibling.color == NodeColor.RED:
-            parent.color, sibling.color = sibling.color, parent.color
+        if sibling.red:
+            if self.stats is not None:
+                self.stats.event('delete_case_2')
+            parent.red, sibling.red = sibling.red, parent.red
             if node == parent.left:
                 self._left_rotate(parent)
             else:  # node == parent.right
@@ -441,16 +1353,18 @@ class RBTree:
              (B) X   Y (B)                (B) X   Y (B)
 
         Step 0: Check if case_3 matched. Otherwise, step into case_4.
-        Step 1: sibling.color = NodeColor.RED
+        Step 1: sibling.red = True
         Step 2: Step into case_1 with parent as the argument.
         """
 
         parent = node.parent
         sibling = parent.right if node == parent.left else parent.left
 
-        if parent.color == NodeColor.BLACK and sibling.color == NodeColor.BLACK and \
-            sibling.left.color == NodeColor.BLACK and sibling.right.color == NodeColor.BLACK:
-            sibling.color = NodeColor.RED
+        if not parent.red and not sibling.red and \
+            not sibling.left.red and not sibling.right.red:
+            if self.stats is not None:
+                self.stats.event('delete_case_3')
+            sibling.red = True
             self._delete_case_1(parent)
         else:
             self._delete_case_4(node)
@@ -473,9 +1387,11 @@ class RBTree:
         parent = node.parent
         sibling = parent.right if node == parent.left else parent.left
 
-        if parent.color == NodeColor.RED and sibling.color == NodeColor.BLACK and \
-            sibling.left.color == NodeColor.BLACK and sibling.right.color == NodeColor.BLACK:
-            parent.color, sibling.color = sibling.color, parent.color
+        if parent.red and not sibling.red and \
+            not sibling.left.red and not sibling.right.red:
+            if self.stats is not None:
+                self.stats.event('delete_case_4')
+            parent.red, sibling.red = sibling.red, parent.red
             return
         self._delete_case_5(node)
 
@@ -519,19 +1435,23 @@ class RBTree:
         parent = node.parent
         sibling = parent.right if node == parent.left else parent.left
 
-        if sibling.color == NodeColor.BLACK:
+        if not sibling.red:
             if node == parent.left and \
-                sibling.left.color == NodeColor.RED and \
-                sibling.right.color == NodeColor.BLACK:
+                sibling.left.red and \
+                not sibling.right.red:
 
-                sibling.left.color, sibling.color = sibling.color, sibling.left.color
+                if self.stats is not None:
+                    self.stats.event('delete_case_5')
+                sibling.left.red, sibling.red = sibling.red, sibling.left.red
                 self._right_rotate(sibling)
 
             elif node == parent.right and \
-                sibling.left.color == NodeColor.BLACK and \
-                sibling.right.color == NodeColor.RED:
+                not sibling.left.red and \
+                sibling.right.red:
 
-                sibling.right.color, sibling.color = sibling.color, sibling.right.color
+                if self.stats is not None:
+                    self.stats.event('delete_case_5')
+                sibling.right.red, sibling.red = sibling.red, sibling.right.red
                 self._left_rotate(sibling)
 
         self._delete_case_6(node)
@@ -550,7 +1470,7 @@ class RBTree:
 
         Step 0: X
         Step 1: _switch_color(parent, sibling)
-        Step 2: sibling.right.color = NodeColor.BLACK
+        Step 2: sibling.right.red = False
         Step 3: _left_rotate(parent)
         Step 4: Terminate.
 
@@ -565,22 +1485,301 @@ class RBTree:
 
         Step 0: X
         Step 1: _switch_color(parent, sibling)
-        Step 2: sibling.left.color = NodeColor.BLACK
+        Step 2: sibling.left.red = False
         Step 3: _right_rotate(parent)
         Step 4: Terminate.
         """
 
+        if self.stats is not None:
+            self.stats.event('delete_case_6')
         parent = node.parent
         sibling = parent.right if node == parent.left else parent.left
 
-        parent.color, sibling.color = sibling.color, parent.color
+        parent.red, sibling.red = sibling.red, parent.red
         if node == parent.left:
-            sibling.right.color = NodeColor.BLACK
+            sibling.right.red = False
             self._left_rotate(parent)
         else:  # node == parent.right
-            sibling.left.color = NodeColor.BLACK
+            sibling.left.red = False
             self._right_rotate(parent)
 
+
+class TopDownRBTree:
+    """
+    Red-Black-Tree repaired on the way down, in a single pass (top-down 2-3-4 tree).
+
+    Insert splits every 4-node (a black node with two red children) met on the way down
+    with a color flip, so the new red leaf never has a red uncle to recolor upwards.
+    Delete pushes a red node down ahead of the search, so the node finally unlinked is red
+    and no double black is left to fix. Both fix the red-red violations they create with
+    at most one rotation per step, while the grandparent is still at hand.
+
+    Nothing ever walks up, so the nodes have no parent pointer and no NullLeaf children:
+    a TopDownRBTreeNode is the compact RBTree node without parent, is_null_leaf and size.
+    lookup, insert and delete behave like those of RBTree.
+    """
+
+    def __init__(self):
+        self.root = None
+        self._len = 0
+        self.stats = None  # TreeStats recording rotations and color flips
+
+    def __len__(self):
+        return self._len
+
+    def __iter__(self):
+        return self.iter_in_order()
+
+    def iter_in_order(self):
+        """
+        Generator yielding the keys in inorder (ascending).
+        """
+
+        stack = []
+        node = self.root
+        while stack or node is not None:
+            while node is not None:
+                stack.append(node)
+                node = node.left
+            node = stack.pop()
+            yield node.val
+            node = node.right
+
+    def iter_level_order(self):
+        """
+        Generator yielding the keys in levelorder.
+        """
+
+        for _, val in self.iter_levels():
+            yield val
+
+    def iter_levels(self):
+        """
+        Generator yielding (depth, key) in levelorder, depth 0 being the root.
+        """
+
+        level = [self.root] if self.root is not None else []
+        depth = 0
+        while level:
+            next_level = []
+            for node in level:
+                yield depth, node.val
+                if node.left is not None:
+                    next_level.append(node.left)
+                if node.right is not None:
+                    next_level.append(node.right)
+            level = next_level
+            depth += 1
+
+    def lookup(self, key):
+        """
+        Return the node holding key, or None.
+        """
+
+        node = self.root
+        while node is not None:
+            if key < node.val:
+                node = node.left
+            elif key > node.val:
+                node = node.right
+            else:
+                return node
+        return None
+
+    def insert(self, key):
+        """
+        Walk down from the root, with the great-grandparent t, grandparent g and parent p
+        of the current node q (a false root above the tree makes t always exist):
+        1. A 4-node q is split: q turns RED and its children BLACK (color flip).
+        2. If q and p are both RED, a single (q on the outside of g) or double (inside)
+           rotation at g moves p (or q) up in place of g, under t.
+        3. The new RED leaf is linked where the walk falls off the tree, and gets the same
+           check as any other q, so the walk stops at the node holding key.
+        Return True if key was inserted, False if it already exists in the tree.
+        """
+
+        if self.root is None:
+            self.root = TopDownRBTreeNode(key)
+            self.root.red = False
+            self._len = 1
+            return True
+
+        head = TopDownRBTreeNode(None)  # False root, the tree is its right child
+        head.red = False
+        head.right = self.root
+        t = head
+        g = p = None
+        q = self.root
+        right = last = True
+        inserted = False
+        while True:
+            if q is None:
+                q = TopDownRBTreeNode(key)
+                if right:
+                    p.right = q
+                else:
+                    p.left = q
+                inserted = True
+            elif q.left is not None and q.left.red and q.right is not None and q.right.red:
+                if self.stats is not None:
+                    self.stats.event('recolor')
+                q.red = True
+                q.left.red = False
+                q.right.red = False
+
+            if q.red and p is not None and p.red:
+                g_right = t.right is g
+                if q is (p.right if last else p.left):
+                    top = self._rotate(g, not last)
+                else:
+                    top = self._double_rotate(g, not last)
+                if g_right:
+                    t.right = top
+                else:
+                    t.left = top
+
+            if key < q.val:
+                child_right = False
+            elif key > q.val:
+                child_right = True
+            else:
+                break
+
+            last, right = right, child_right
+            if g is not None:
+                t = g
+            g, p = p, q
+            q = q.right if right else q.left
+
+        self.root = head.right
+        self.root.red = False
+        if inserted:
+            self._len += 1
+        return inserted
+
+    def delete(self, key):
+        """
+        Walk down from a false root to the in-order predecessor of key (or to the leaf
+        where key would be), keeping the current node q RED or with a RED child ahead:
+        1. If q and its next child are BLACK but its other child is RED,
+           a single rotation at q puts that RED child above q, as the new p.
+        2. If both children of q are BLACK, look at the sibling s of q:
+           - s has two BLACK children: color flip, p BLACK, q and s RED.
+           - otherwise a single or double rotation at p borrows a RED node of s,
+             and the recoloring leaves q RED, under a RED parent with BLACK children.
+        The key is then replaced by the predecessor, which is a RED leaf or has one
+        child, and is unlinked without any fix.
+        """
+
+        if self.root is None:
+            print('The tree is empty.')
+            return
+
+        head = TopDownRBTreeNode(None)
+        head.red = False
+        head.right = self.root
+        g = p = None
+        q = head
+        right = True
+        found = None
+        while (q.right if right else q.left) is not None:
+            last = right
+            g, p = p, q
+            q = q.right if right else q.left
+            if key > q.val:
+                right = True
+            else:
+                right = False
+                if not key < q.val:
+                    found = q
+
+            # Push the RED node down
+            ahead = q.right if right else q.left
+            if q.red or (ahead is not None and ahead.red):
+                continue
+            other = q.left if right else q.right
+            if other is not None and other.red:
+                top = self._rotate(q, right)
+                if last:
+                    p.right = top
+                else:
+                    p.left = top
+                p = top
+                continue
+
+            s = p.left if last else p.right
+            if s is None:
+                continue
+            s_near = s.right if last else s.left
+            s_far = s.left if last else s.right
+            if (s_near is None or not s_near.red) and (s_far is None or not s_far.red):
+                if self.stats is not None:
+                    self.stats.event('recolor')
+                p.red = False
+                s.red = True
+                q.red = True
+            else:
+                g_right = g.right is p
+                if s_near is not None and s_near.red:
+                    top = self._double_rotate(p, last)
+                else:
+                    top = self._rotate(p, last)
+                if g_right:
+                    g.right = top
+                else:
+                    g.left = top
+                q.red = top.red = True
+                top.left.red = False
+                top.right.red = False
+
+        if found is not None:
+            found.val = q.val
+            found.value = q.value
+            child = q.right if q.left is None else q.left
+            if p.right is q:
+                p.right = child
+            else:
+                p.left = child
+            self._len -= 1
+
+        self.root = head.right
+        if self.root is not None:
+            self.root.red = False
+        if found is None:
+            print('The key does not exist in the tree')
+
+    def _rotate(self, node, right):
+        """
+        Single rotation of node to the right (its left child moves up) or to the left.
+        The child which moves up turns BLACK, node turns RED. Return the new subtree root.
+        """
+
+        if self.stats is not None:
+            self.stats.event('rotate_right' if right else 'rotate_left')
+        if right:
+            child = node.left
+            node.left = child.right
+            child.right = node
+        else:
+            child = node.right
+            node.right = child.left
+            child.left = node
+        node.red = True
+        child.red = False
+        return child
+
+    def _double_rotate(self, node, right):
+        """
+        Rotate the child of node opposite to the rotation, then node itself:
+        the grandchild on the inside moves up. Return the new subtree root.
+        """
+
+        if right:
+            node.left = self._rotate(node.left, False)
+        else:
+            node.right = self._rotate(node.right, True)
+        return self._rotate(node, right)
+
 """
 Two driver programs to test above functions.
 """
@@ -659,3 +1858,125 @@ delete(10):  Case 1 (self.root = None)
 # for num in nums:
 #     myTree.delete(num)
 #
+
+"""
+3. Memory benchmark of the two node layouts (tracemalloc, 100000 random keys).
+Measured on CPython 3.11:
+    default layout : ~24.4 MB (3 objects per key, each with a __dict__)
+    compact layout : ~7.6 MB  (1 __slots__ object per key + 1 shared NullLeaf)
+"""
+# import random
+# import tracemalloc
+# from red_black_tree import RBTree
+# keys = random.sample(range(10 ** 7), 100000)
+# for compact in (False, True):
+#     tracemalloc.start()
+#     myTree = RBTree(compact=compact)
+#     for key in keys:
+#         myTree.insert(key)
+#     current, _ = tracemalloc.get_traced_memory()
+#     tracemalloc.stop()
+#     print(f'compact={compact}: {current / 2 ** 20:.1f} MB')
+
+"""
+4. Insert benchmark over random, sorted and reverse-sorted key streams
+(timeit, 100000 keys, each stream in a fresh process), measured on CPython 3.11
+against the former lookup + recursive _bst_insert path:
+                 before     after   (per insert)
+    random   :  20.2 us   14.6 us
+    sorted   :  13.2 us    8.3 us
+    reverse  :  11.9 us    8.3 us
+"""
+# import random
+# import sys
+# import timeit
+# from red_black_tree import RBTree
+# N = 100000
+# keys = {'random': random.sample(range(10 ** 7), N),
+#         'sorted': list(range(N)),
+#         'reverse': list(range(N, 0, -1))}[sys.argv[1]]
+# myTree = RBTree()
+# t0 = timeit.default_timer()
+# for key in keys:
+#     myTree.insert(key)
+# print(f'{sys.argv[1]}: {(timeit.default_timer() - t0) / N * 1e6:.1f} us')
+
+"""
+5. Color as the bool node.red against the former NodeColor Enum attribute
+(30000 random keys inserted then deleted, best of 20 runs, CPython 3.11, k operations per second):
+                        insert             delete
+                     Enum    bool       Enum    bool
+    default layout   111k    152k  +37%  188k    203k   +8%
+    compact layout   249k    350k  +41%  254k    364k  +43%
+`node.color == NodeColor.RED` loads the global NodeColor, looks RED up on the Enum class and
+calls ==, while `node.red` is a single attribute load (0.19 against 0.02 us per test here).
+"""
+# import random
+# import timeit
+# from red_black_tree import RBTree
+# N = 30000
+# keys = random.sample(range(10 ** 7), N)
+# for compact in (False, True):
+#     myTree = RBTree(compact=compact)
+#     t0 = timeit.default_timer()
+#     for key in keys:
+#         myTree.insert(key)
+#     t1 = timeit.default_timer()
+#     for key in keys:
+#         myTree.delete(key)
+#     t2 = timeit.default_timer()
+#     print(f'compact={compact}: insert {N / (t1 - t0) / 1000:.0f}k/s, delete {N / (t2 - t1) / 1000:.0f}k/s')
+
+"""
+6. Level-order traversal of a tree built with from_sorted (best of 3, CPython 3.11):
+                                   100000 keys   1000000 keys
+    list queue with pop(0)            0.68 s        98.58 s
+    deque of (node, depth) pairs      0.13 s         1.27 s
+    iter_level_order (deque)          0.08 s         0.77 s
+    iter_levels (list per level)      0.10 s         0.79 s
+pop(0) shifts the whole queue, which holds up to a level (half the tree), so it is quadratic.
+iter_levels yields the depth with every key without allocating a pair per queued node.
+"""
+# import timeit
+# from red_black_tree import RBTree
+# for N in (100000, 1000000):
+#     myTree = RBTree.from_sorted(range(N))
+#     for name in ('iter_level_order', 'iter_levels'):
+#         walk = getattr(myTree, name)
+#         print(N, name, f'{min(timeit.repeat(lambda: sum(1 for _ in walk()), number=1, repeat=3)):.2f} s')
+
+"""
+7. TopDownRBTree against the bottom-up RBTree (100000 keys inserted then deleted,
+best of 3 per insert/delete, memory of the 100000 random keys with tracemalloc, CPython 3.11):
+                           random          sorted         memory
+    RBTree               14.1 / 7.0 us   12.0 / 2.3 us   26.7 MB
+    RBTree(compact=True)  5.7 / 4.5 us    5.9 / 2.7 us    9.2 MB
+    TopDownRBTree         6.9 / 7.6 us    6.1 / 5.4 us    6.9 MB
+No parent pointer, NullLeaf or size field saves a quarter of the compact layout.
+It is not faster in Python: the bottom-up fix-up usually stops after one or two levels,
+while the top-down pass tests colors (and may flip or rotate) at every level of the descent,
+which costs the most on delete, where the RED node is pushed down all the way.
+"""
+# import random
+# import timeit
+# import tracemalloc
+# from red_black_tree import RBTree, TopDownRBTree
+# N = 100000
+# keys = random.sample(range(10 ** 7), N)
+# for make in (RBTree, lambda: RBTree(compact=True), TopDownRBTree):
+#     myTree = make()
+#     t0 = timeit.default_timer()
+#     for key in keys:
+#         myTree.insert(key)
+#     t1 = timeit.default_timer()
+#     for key in keys:
+#         myTree.delete(key)
+#     t2 = timeit.default_timer()
+#     tracemalloc.start()
+#     myTree = make()
+#     for key in keys:
+#         myTree.insert(key)
+#     memory = tracemalloc.get_traced_memory()[0]
+#     tracemalloc.stop()
+#     print(type(myTree).__name__, f'{(t1 - t0) / N * 1e6:.1f} / {(t2 - t1) / N * 1e6:.1f} us,',
+#           f'{memory / 2 ** 20:.1f} MB')
@@ -0,0 +1,267 @@
+"""
+Python code to partition a sorted set of keys across worker processes, one tree per process
+"""
+import bisect
+import heapq
+import multiprocessing
+
+from b_tree import BTree
+from red_black_tree import RBTree
+
+
+class ShardedTree:
+    """
+    Sorted set of keys split across shards, each one a worker process owning its own tree,
+    so that the shards use one core each instead of sharing the GIL.
+
+    boundaries: sorted split keys for range partitioning. Shard i holds the keys
+        boundaries[i-1] <= key < boundaries[i], so there are len(boundaries) + 1 shards,
+        and a range request only goes to the shards it overlaps.
+        Without boundaries, keys are hash-partitioned across the given number of shards,
+        and the results of a range request are merged with heapq.merge.
+    backend: 'rb' for RBTree (default) or 'btree' for BTree.
+    Other keyword arguments are passed to the tree constructor (e.g. m=64).
+
+    A batch is cut into one request per shard, all the requests are sent before
+    the first reply is read, so the shards work on it in parallel.
+    Every key of a shard goes through a pipe, so batches should be large:
+    a single key costs a round trip to the worker.
+    """
+
+    def __init__(self, shards=4, boundaries=None, backend='rb', **kwargs):
+        if backend not in ('rb', 'btree'):
+            raise ValueError(f"Unknown backend {backend!r}, use 'rb' or 'btree'")
+        if boundaries is not None:
+            boundaries = list(boundaries)
+            if any(not a < b for a, b in zip(boundaries, boundaries[1:])):
+                raise ValueError('The shard boundaries must be strictly ascending')
+            shards = len(boundaries) + 1
+        elif shards < 1:
+            raise ValueError('A ShardedTree needs at least one shard')
+
+        self.boundaries = boundaries
+        self.backend = backend
+        self.connections = []
+        self.processes = []
+        for _ in range(shards):
+            parent_conn, child_conn = multiprocessing.Pipe()
+            process = multiprocessing.Process(target=_serve_shard, args=(child_conn, backend, kwargs),
+                                              daemon=True)
+            process.start()
+            child_conn.close()
+            self.connections.append(parent_conn)
+            self.processes.append(process)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def __len__(self):
+        return sum(self._fan_out({i: ('len',) for i in range(len(self.connections))}).values())
+
+    def __contains__(self, key):
+        return self.lookup_many([key])[0]
+
+    def __iter__(self):
+        return self.range()
+
+    def close(self):
+        """
+        Stop the worker processes. The keys are lost.
+        """
+
+        for conn in self.connections:
+            try:
+                conn.send(('close',))
+            except (BrokenPipeError, OSError):
+                pass
+            conn.close()
+        for process in self.processes:
+            process.join()
+        self.connections = []
+        self.processes = []
+
+    def shard_of(self, key):
+        """
+        Return the index of the shard holding key.
+        """
+
+        if self.boundaries is not None:
+            return bisect.bisect_right(self.boundaries, key)
+        return hash(key) % len(self.connections)
+
+    def insert_many(self, keys, **kwargs):
+        """
+        Insert a batch of keys, and return the number of keys inserted.
+        Keyword arguments (on_duplicate) are passed to the insert_many of every shard;
+        on_duplicate='error' is checked shard by shard, so the other shards may be updated.
+        """
+
+        return sum(self._fan_out({i: ('insert_many', batch, kwargs)
+                                  for i, batch in self._partition(keys).items()}).values())
+
+    def delete_many(self, keys, **kwargs):
+        """
+        Delete a batch of keys, and return the number of keys deleted.
+        Keyword arguments (on_missing) are passed to the delete_many of every shard.
+        """
+
+        return sum(self._fan_out({i: ('delete_many', batch, kwargs)
+                                  for i, batch in self._partition(keys).items()}).values())
+
+    def lookup_many(self, keys):
+        """
+        Return a list telling for every key of the batch (in the same order) if it is in the tree.
+        """
+
+        keys = list(keys)
+        positions = {}
+        for pos, key in enumerate(keys):
+            positions.setdefault(self.shard_of(key), []).append(pos)
+        replies = self._fan_out({i: ('lookup_many', [keys[pos] for pos in shard_positions])
+                                 for i, shard_positions in positions.items()})
+
+        found = [False] * len(keys)
+        for i, shard_positions in positions.items():
+            for pos, is_found in zip(shard_positions, replies[i]):
+                found[pos] = is_found
+        return found
+
+    def range(self, lo=None, hi=None, inclusive=(True, True)):
+        """
+        Generator yielding the keys between lo and hi in ascending order (see RBTree.range).
+        Every shard sends its whole part of the range at once.
+        """
+
+        if self.boundaries is None:
+            shards = range(len(self.connections))
+        else:
+            first = 0 if lo is None else bisect.bisect_right(self.boundaries, lo)
+            last = len(self.boundaries) if hi is None else bisect.bisect_right(self.boundaries, hi)
+            shards = range(first, last + 1)
+        replies = self._fan_out({i: ('range', lo, hi, inclusive) for i in shards})
+
+        if self.boundaries is None:
+            yield from heapq.merge(*replies.values())
+        else:
+            for i in shards:
+                yield from replies[i]
+
+    def _partition(self, keys):
+        """
+        Return a dict of the keys of the batch per shard index.
+        """
+
+        batches = {}
+        for key in keys:
+            batches.setdefault(self.shard_of(key), []).append(key)
+        return batches
+
+    def _fan_out(self, requests):
+        """
+        Send every request (a dict of shard index to request) before reading the replies,
+        and return the dict of replies. An exception raised in a shard is raised here,
+        once all the replies are read.
+        """
+
+        for i, request in requests.items():
+            self.connections[i].send(request)
+        replies = {}
+        error = None
+        for i in requests:
+            ok, reply = self.connections[i].recv()
+            if ok:
+                replies[i] = reply
+            elif error is None:
+                error = reply
+        if error is not None:
+            raise error
+        return replies
+
+
+def _serve_shard(conn, backend, kwargs):
+    """
+    Main loop of a shard process: own a tree and answer the requests received on conn
+    with (True, result) or (False, exception) until a 'close' request.
+    """
+
+    tree = RBTree(**kwargs) if backend == 'rb' else BTree(**kwargs)
+    find = tree.lookup if backend == 'rb' else tree.search
+    while True:
+        try:
+            request = conn.recv()
+        except EOFError:
+            break
+        op = request[0]
+        if op == 'close':
+            break
+
+        try:
+            if op == 'insert_many':
+                result = tree.insert_many(request[1], **request[2])
+            elif op == 'delete_many':
+                result = tree.delete_many(request[1], **request[2])
+            elif op == 'lookup_many':
+                result = [find(key) is not None for key in request[1]]
+            elif op == 'range':
+                result = list(tree.range(*request[1:]))
+            elif op == 'len':
+                result = len(tree)
+            else:
+                raise ValueError(f'Unknown shard request {op!r}')
+        except Exception as error:
+            conn.send((False, error))
+        else:
+            conn.send((True, result))
+    conn.close()
+
+
+"""
+Driver program to test above class.
+"""
+# if __name__ == '__main__':
+#     with ShardedTree(boundaries=[100, 200, 300]) as myTree:
+#         myTree.insert_many(range(0, 400, 7))
+#         print(len(myTree), myTree.lookup_many([7, 8]))  # 58 [True, False]
+#         print(list(myTree.range(95, 110)))  # [98, 105]
+
+
+"""
+Throughput benchmark (400000 random keys in batches of 10000, RBTree shards, CPython 3.11),
+against one RBTree in the calling process (insert_many, then a lookup per key):
+                          insert     lookup    range over 10% of the keys
+    RBTree in process     28k/s     135k/s
+    1 shard               19k/s     119k/s         60 ms
+    2 shards, hash        19k/s     118k/s         77 ms
+    2 shards, range       20k/s     118k/s         61 ms
+    4 shards, hash        18k/s     126k/s         80 ms
+    4 shards, range       18k/s     114k/s         57 ms
+This machine has a single core, so the shards take turns and the table only shows the cost
+of the pipes (about a third of the insert rate, a tenth of the lookup rate). The work of a
+batch is split evenly between the shards, so with one core per shard the throughput grows
+with the number of shards until the calling process (partitioning and pickling) is the limit.
+A hash-partitioned range asks every shard and merges; a range-partitioned one asks only
+the shards it overlaps.
+"""
+# import random
+# import timeit
+# if __name__ == '__main__':
+#     N, BATCH = 400000, 10000
+#     keys = random.sample(range(10 ** 8), N)
+#     batches = [keys[i:i + BATCH] for i in range(0, N, BATCH)]
+#     for shards in (1, 2, 4):
+#         for kwargs in (dict(shards=shards), dict(boundaries=[10 ** 8 * i // shards for i in range(1, shards)])):
+#             with ShardedTree(**kwargs) as myTree:
+#                 t0 = timeit.default_timer()
+#                 for batch in batches:
+#                     myTree.insert_many(batch)
+#                 t1 = timeit.default_timer()
+#                 for batch in batches:
+#                     myTree.lookup_many(batch)
+#                 t2 = timeit.default_timer()
+#                 list(myTree.range(0, 10 ** 7))
+#                 t3 = timeit.default_timer()
+#             print(shards, kwargs, f'insert {N / (t1 - t0) / 1000:.0f}k/s, '
+#                   f'lookup {N / (t2 - t1) / 1000:.0f}k/s, range {(t3 - t2) * 1000:.0f} ms')
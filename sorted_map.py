@@ -0,0 +1,180 @@
+"""
+Python code to implement a sorted dict on top of a Red-Black-Tree or an AVL tree
+"""
+from collections.abc import ItemsView, MutableMapping, ValuesView
+
+from avl_tree import AVLtree
+from red_black_tree import RBTree
+
+
+_MISSING = object()
+
+
+class SortedMap(MutableMapping):
+    """
+    Mapping whose keys are kept in ascending order by a balanced search tree.
+
+    The value of a key is stored inline in its tree node (node.value), so there is no
+    parallel dict, and m[key] = value is a single descent of the tree (upsert).
+    backend: 'rb' for RBTree (default) or 'avl' for AVLtree.
+    Other keyword arguments are passed to the tree constructor (e.g. compact=True).
+    """
+
+    def __init__(self, items=(), backend='rb', **kwargs):
+        if backend == 'rb':
+            self.tree = RBTree(**kwargs)
+        elif backend == 'avl':
+            self.tree = AVLtree(**kwargs)
+        else:
+            raise ValueError(f"Unknown backend {backend!r}, use 'rb' or 'avl'")
+
+        self.backend = backend
+        self.root = None  # Root of the AVLtree backend (RBTree keeps its own root).
+        self._len = 0
+        self.update(items)
+
+    def __getitem__(self, key):
+        node = self._find(key)
+        if node is None:
+            raise KeyError(key)
+        return node.value
+
+    def __setitem__(self, key, value):
+        if self.backend == 'rb':
+            node, inserted = self.tree._insert_node(key)
+        else:
+            self.root, node, inserted = self.tree._upsert(self.root, key)
+        node.value = value
+        if inserted:
+            self._len += 1
+
+    def __delitem__(self, key):
+        self.pop(key)
+
+    def __contains__(self, key):
+        return self._find(key) is not None
+
+    def __iter__(self):
+        for node in self._iter_nodes():
+            yield node.val
+
+    def __reversed__(self):
+        for node in self._iter_nodes(reverse=True):
+            yield node.val
+
+    def __len__(self):
+        return self._len
+
+    def __repr__(self):
+        return f'SortedMap({dict(self.items())!r})'
+
+    def get(self, key, default=None):
+        node = self._find(key)
+        return default if node is None else node.value
+
+    def pop(self, key, default=_MISSING):
+        """
+        Remove key and return its value.
+        Return default if key is missing, or raise KeyError if no default is given.
+        """
+
+        node = self._find(key)
+        if node is None:
+            if default is _MISSING:
+                raise KeyError(key)
+            return default
+
+        value = node.value
+        if self.backend == 'rb':
+            self.tree._delete_node(node)
+        else:
+            self.root = self.tree.delete(self.root, key)
+        self._len -= 1
+        return value
+
+    def items(self):
+        """
+        View of the (key, value) pairs in key order.
+        """
+
+        return _SortedItemsView(self)
+
+    def values(self):
+        """
+        View of the values in key order.
+        """
+
+        return _SortedValuesView(self)
+
+    def irange(self, lo=None, hi=None, inclusive=(True, True)):
+        """
+        Generator yielding the keys between lo and hi in ascending order (see RBTree.range).
+        """
+
+        if self.backend == 'rb':
+            return self.tree.range(lo, hi, inclusive)
+        return self.tree.range(self.root, lo, hi, inclusive)
+
+    def _find(self, key):
+        """
+        Return the node holding key, or None.
+        """
+
+        if self.backend == 'rb':
+            return self.tree.lookup(key)
+        return self.tree.lookup(self.root, key)
+
+    def _iter_nodes(self, reverse=False):
+        """
+        Generator yielding the tree nodes in key order (descending if reverse).
+        """
+
+        if self.backend == 'rb':
+            node = self.tree.root
+
+            def is_empty(node):
+                return node is None or node.is_null_leaf
+        else:
+            node = self.root
+
+            def is_empty(node):
+                return node is None
+
+        stack = []
+        while stack or not is_empty(node):
+            while not is_empty(node):
+                stack.append(node)
+                node = node.right if reverse else node.left
+            node = stack.pop()
+            yield node
+            node = node.left if reverse else node.right
+
+
+class _SortedItemsView(ItemsView):
+    """
+    ItemsView reading the values from the nodes instead of looking every key up again.
+    """
+
+    def __iter__(self):
+        for node in self._mapping._iter_nodes():
+            yield node.val, node.value
+
+
+class _SortedValuesView(ValuesView):
+    """
+    ValuesView reading the values from the nodes instead of looking every key up again.
+    """
+
+    def __iter__(self):
+        for node in self._mapping._iter_nodes():
+            yield node.value
+
+
+"""
+Driver program to test above class.
+"""
+# myMap = SortedMap({5: 'five', 1: 'one'})
+# myMap[3] = 'three'
+# myMap[5] = 'FIVE'
+# print(list(myMap.items()))  # [(1, 'one'), (3, 'three'), (5, 'FIVE')]
+# print(myMap.pop(1), list(myMap))  # one [3, 5]
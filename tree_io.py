@@ -0,0 +1,556 @@
+"""
+Python code to save the trees to a compact binary file and load them back in linear time
+"""
+import gc
+import io
+import pickle
+import struct
+import zlib
+from array import array
+
+from avl_tree import AVLtree, PersistentAVLtree
+from avl_tree import TreeNode as AVLTreeNode
+from b_tree import BPlusTree, BTree
+from binary_search_tree import BST
+from binary_search_tree import TreeNode as BSTTreeNode
+from red_black_tree import RBTree
+
+
+MAGIC = b'TREE'
+VERSION = 2
+HEADER = struct.Struct('<4sHBBIQ')  # magic, version, kind, flags, m, number of nodes
+CHUNK = struct.Struct('<IBBII')  # nodes, key codec, value codec, key bytes, value bytes
+CRC = struct.Struct('<I')  # crc32 of the file up to here, after the header and every chunk
+CHUNK_NODES = 65536  # Nodes per chunk of a binary tree
+CHUNK_PAGES = 4096  # Nodes per chunk of a B-Tree
+
+# Kind of tree in the header, with the classes loaded back
+KINDS = {BST: 1, AVLtree: 2, PersistentAVLtree: 3, RBTree: 4, BTree: 5, BPlusTree: 6}
+CLASSES = {kind: cls for cls, kind in KINDS.items()}
+
+# Flags in the header
+ORDER_STATISTIC = 1
+COMPACT = 2
+
+# Shape byte of a node of a binary tree (pre-order)
+HAS_LEFT = 1
+HAS_RIGHT = 2
+RED = 4
+
+# Header word of a B-Tree node: number of keys, and this bit for a leaf
+LEAF = 1 << 31
+
+INT64_MIN = -(1 << 63)
+INT64_MAX = (1 << 63) - 1
+
+
+def dump(tree, fp, root=None):
+    """
+    Write tree to the binary file fp.
+
+    Binary trees (BST, AVLtree, PersistentAVLtree, RBTree) are written in pre-order with
+    one shape byte per node (which children it has, and its color for an RBTree);
+    heights and subtree sizes are not written, they are recomputed on load.
+    B-Trees (BTree, BPlusTree) are written node by node in pre-order, each node as a word
+    holding its number of keys and a leaf bit, followed by its keys.
+    Nodes go in chunks, with the keys (and values) of a chunk in one column: packed as
+    int64 or float64 if they all are, otherwise pickled as one flat list.
+    The file is versioned. The header, every chunk header and every chunk data are
+    followed by the crc32 of the file up to there, so load checks each part before
+    decoding it; a truncated, reordered or altered file fails at the first bad part.
+    root: the root of the tree for the trees which take it as a parameter (BST, AVLtree).
+    ArrayAVLtree and ArrayBST are flat arrays, which pickle fast already.
+    """
+
+    kind = KINDS.get(type(tree))
+    if kind is None:
+        raise TypeError(f'Cannot dump a {type(tree).__name__}')
+    flags = 0
+    if getattr(tree, 'order_statistic', False):
+        flags |= ORDER_STATISTIC
+    if getattr(tree, 'compact', False):
+        flags |= COMPACT
+
+    writer = _Writer(fp)
+    if isinstance(tree, BTree):
+        root = tree.root
+        chunks = _btree_chunks(root, isinstance(tree, BPlusTree))
+        count = _count_btree_nodes(root)
+    else:
+        if isinstance(tree, RBTree):
+            root = tree.root if tree.root is not None and not tree.root.is_null_leaf else None
+        chunks = _binary_chunks(root, isinstance(tree, RBTree))
+        count = _count_binary_nodes(root, isinstance(tree, RBTree))
+
+    writer.write(HEADER.pack(MAGIC, VERSION, kind, flags, getattr(tree, 'm', 0), count))
+    writer.write_crc()
+    for structure, keys, values in chunks:
+        _write_chunk(writer, structure, keys, values)
+    writer.write(CHUNK.pack(0, 0, 0, 0, 0))
+    writer.write_crc()
+
+
+def dumps(tree, root=None):
+    """
+    Return the binary dump of tree as bytes (see dump).
+    """
+
+    fp = io.BytesIO()
+    dump(tree, fp, root)
+    return fp.getvalue()
+
+
+def load(fp):
+    """
+    Read a tree written by dump from the binary file fp and return it, or (tree, root)
+    for the trees which take the root as a parameter (BST, AVLtree, PersistentAVLtree).
+    The nodes are linked as they are read, without insert or any rotation, in O(n).
+    Raise ValueError if the file is not a tree dump, has another version, is truncated
+    or is corrupted: every part is checked against its checksum before it is decoded
+    (or unpickled), and a part which passes it but cannot be decoded is reported too.
+    The checksums catch accidental damage, not a forged file: a dump holding pickled
+    keys must come from a trusted source, like any pickle.
+    """
+
+    reader = _Reader(fp)
+    magic, version, kind, flags, m, count = HEADER.unpack(reader.read(HEADER.size))
+    if magic != MAGIC:
+        raise ValueError('Not a tree dump')
+    if version != VERSION:
+        raise ValueError(f'Unsupported tree dump version {version}')
+    reader.check_crc()
+    cls = CLASSES.get(kind)
+    if cls is None:
+        raise ValueError(f'Unknown kind of tree {kind}')
+
+    order_statistic = bool(flags & ORDER_STATISTIC)
+    if cls is BPlusTree:
+        tree = BPlusTree(m)
+    elif issubclass(cls, BTree):
+        tree = cls(m, order_statistic=order_statistic)
+    elif cls is RBTree:
+        tree = RBTree(compact=bool(flags & COMPACT), order_statistic=order_statistic)
+    elif cls is BST:
+        tree = BST()
+    else:
+        tree = cls(order_statistic=order_statistic)
+
+    # The cyclic GC would run every few hundred new nodes and scan all the nodes loaded
+    # so far, which is most of the load time: pause it, the nodes are all kept anyway.
+    gc_enabled = gc.isenabled()
+    gc.disable()
+    try:
+        chunks = _read_chunks(reader, 4 if isinstance(tree, BTree) else 1)
+        if isinstance(tree, BTree):
+            tree.root, loaded = _load_btree(tree, chunks)
+            if isinstance(tree, BPlusTree):
+                tree._len = sum(len(node.keys) for node in loaded if node.is_leaf)
+        else:
+            root, loaded = _load_binary(tree, chunks)
+    except (IndexError, KeyError, TypeError, AttributeError, EOFError, struct.error,
+            pickle.UnpicklingError) as error:
+        # A chunk which matches its checksum but still does not decode
+        raise ValueError(f'Corrupted tree dump: {error!r}') from error
+    finally:
+        if gc_enabled:
+            gc.enable()
+    if len(loaded) != count:
+        raise ValueError('Corrupted tree dump: wrong number of nodes')
+
+    if isinstance(tree, (BTree, RBTree)):
+        if isinstance(tree, RBTree):
+            tree.root = root
+        return tree
+    return tree, root
+
+
+def loads(data):
+    """
+    Load a tree from the bytes returned by dumps (see load).
+    """
+
+    return load(io.BytesIO(data))
+
+
+class _Writer:
+    """
+    File writer keeping the crc32 of what was written.
+    """
+
+    def __init__(self, fp):
+        self.fp = fp
+        self.crc = 0
+
+    def write(self, data):
+        self.crc = zlib.crc32(data, self.crc)
+        self.fp.write(data)
+
+    def write_crc(self):
+        """
+        Write the crc32 of everything written so far (it is part of the next crc).
+        """
+
+        self.write(CRC.pack(self.crc))
+
+
+class _Reader:
+    """
+    File reader keeping the crc32 of what was read.
+    """
+
+    def __init__(self, fp):
+        self.fp = fp
+        self.crc = 0
+
+    def read(self, size):
+        data = self.fp.read(size)
+        if len(data) != size:
+            raise ValueError('Truncated tree dump')
+        self.crc = zlib.crc32(data, self.crc)
+        return data
+
+    def check_crc(self):
+        """
+        Read the crc32 written by _Writer.write_crc and compare it to what was read.
+        """
+
+        crc = self.crc
+        if self.read(CRC.size) != CRC.pack(crc):
+            raise ValueError('Corrupted tree dump: checksum mismatch')
+
+
+def _count_binary_nodes(root, rb):
+    count = 0
+    stack = [root] if root is not None else []
+    while stack:
+        node = stack.pop()
+        count += 1
+        for child in (node.left, node.right):
+            if child is not None and not (rb and child.is_null_leaf):
+                stack.append(child)
+    return count
+
+
+def _count_btree_nodes(root):
+    count = 0
+    stack = [root] if root is not None else []
+    while stack:
+        node = stack.pop()
+        count += 1
+        if not node.is_leaf:
+            stack.extend(node.C[:node.n + 1])
+    return count
+
+
+def _binary_chunks(root, rb):
+    """
+    Generator yielding (shape bytes, keys, values) for the nodes in pre-order, by chunk.
+    """
+
+    shapes = bytearray()
+    keys = []
+    values = []
+    stack = [root] if root is not None else []
+    while stack:
+        node = stack.pop()
+        left, right = node.left, node.right
+        if rb:
+            left = None if left.is_null_leaf else left
+            right = None if right.is_null_leaf else right
+        shape = 0
+        if left is not None:
+            shape |= HAS_LEFT
+        if right is not None:
+            shape |= HAS_RIGHT
+            stack.append(right)
+        if left is not None:
+            stack.append(left)
+        if rb and node.red:
+            shape |= RED
+        shapes.append(shape)
+        keys.append(node.val)
+        values.append(getattr(node, 'value', None))
+        if len(shapes) == CHUNK_NODES:
+            yield shapes, keys, values
+            shapes, keys, values = bytearray(), [], []
+    if shapes:
+        yield shapes, keys, values
+
+
+def _btree_chunks(root, plus):
+    """
+    Generator yielding (node words, keys, values) for the nodes in pre-order, by chunk.
+    Only the leaves of a B+ Tree have values.
+    """
+
+    words = array('I')
+    keys = []
+    values = []
+    stack = [root] if root is not None else []
+    while stack:
+        node = stack.pop()
+        words.append(node.n | (LEAF if node.is_leaf else 0))
+        keys.extend(node.keys)
+        if node.is_leaf:
+            if plus:
+                values.extend(node.values)
+        else:
+            stack.extend(reversed(node.C[:node.n + 1]))
+        if len(words) == CHUNK_PAGES:
+            yield words.tobytes(), keys, values
+            words, keys, values = array('I'), [], []
+    if words:
+        yield words.tobytes(), keys, values
+
+
+def _encode(items):
+    """
+    Return (codec, bytes) for a column of keys or values:
+    'q' int64, 'd' float64, 'n' all None, 'p' pickled list.
+    """
+
+    if all(item is None for item in items):
+        return ord('n'), b''
+    if all(type(item) is int for item in items) and \
+            INT64_MIN <= min(items) and max(items) <= INT64_MAX:
+        return ord('q'), array('q', items).tobytes()
+    if all(type(item) is float for item in items):
+        return ord('d'), array('d', items).tobytes()
+    return ord('p'), pickle.dumps(items, pickle.HIGHEST_PROTOCOL)
+
+
+def _decode(codec, data):
+    """
+    Return the column encoded by _encode as a list, or None for 'n' (all None).
+    """
+
+    if codec == ord('n'):
+        return None
+    if codec in (ord('q'), ord('d')):
+        return array(chr(codec), data).tolist()
+    if codec == ord('p'):
+        return pickle.loads(data)
+    raise ValueError(f'Corrupted tree dump: unknown codec {codec}')
+
+
+def _write_chunk(writer, structure, keys, values):
+    key_codec, key_bytes = _encode(keys)
+    value_codec, value_bytes = _encode(values)
+    count = len(structure) if isinstance(structure, bytearray) else len(structure) // 4
+    writer.write(CHUNK.pack(count, key_codec, value_codec, len(key_bytes), len(value_bytes)))
+    writer.write_crc()
+    writer.write(structure)
+    writer.write(key_bytes)
+    writer.write(value_bytes)
+    writer.write_crc()
+
+
+def _read_chunks(reader, width):
+    """
+    Generator yielding (number of nodes, structure, keys, values) for every chunk, until
+    the end marker; the chunk header is checked before its sizes are used, and the chunk
+    data before its keys and values are decoded.
+    A binary tree chunk has a shape byte per node (width 1), a B-Tree chunk a 4-byte word.
+    """
+
+    while True:
+        count, key_codec, value_codec, key_size, value_size = CHUNK.unpack(reader.read(CHUNK.size))
+        reader.check_crc()
+        if count == 0:
+            return
+        structure = reader.read(width * count)
+        key_bytes = reader.read(key_size)
+        value_bytes = reader.read(value_size)
+        reader.check_crc()
+        keys = _decode(key_codec, key_bytes)
+        values = _decode(value_codec, value_bytes)
+        yield count, structure, keys, values
+
+
+def _load_binary(tree, chunks):
+    """
+    Link the nodes of a pre-order dump and return (root, nodes in pre-order).
+    A node goes where the previous one asked for a child: its left child if it has one,
+    else its right child, else the right child of the last node still waiting for one.
+    Heights and sizes are then computed in reverse pre-order (children before parents).
+    """
+
+    rb = isinstance(tree, RBTree)
+    if rb:
+        new_node = tree._new_node
+    elif isinstance(tree, AVLtree):
+        new_node = AVLTreeNode
+    else:
+        new_node = BSTTreeNode
+
+    nodes = []
+    root = None
+    stack = []  # Nodes whose right child comes later
+    parent = None
+    left_side = False
+    for count, shapes, keys, values in chunks:
+        if keys is None:
+            keys = [None] * count
+        has_values = values is not None
+        if not has_values:
+            values = keys
+        if len(keys) != count or len(values) != count:
+            raise ValueError('Corrupted tree dump: wrong number of keys')
+        for shape, key, value in zip(shapes, keys, values):
+            node = new_node(key)
+            if has_values:
+                node.value = value
+            if parent is None:
+                if root is not None:
+                    raise ValueError('Corrupted tree dump: nodes after the last leaf')
+                root = node
+            elif left_side:
+                parent.left = node
+            else:
+                parent.right = node
+            if rb:
+                node.parent = parent
+                if not shape & RED:
+                    node.red = False
+            nodes.append(node)
+
+            if shape & HAS_LEFT:
+                if shape & HAS_RIGHT:
+                    stack.append(node)
+                parent, left_side = node, True
+            elif shape & HAS_RIGHT:
+                parent, left_side = node, False
+            elif stack:
+                parent, left_side = stack.pop(), False
+            else:
+                parent = None
+    if parent is not None:
+        raise ValueError('Corrupted tree dump: missing nodes')
+
+    if rb:
+        if tree.order_statistic:
+            for node in reversed(nodes):
+                node.size = 1 + node.left.size + node.right.size
+    else:
+        order_statistic = getattr(tree, 'order_statistic', False)
+        for node in reversed(nodes):
+            left, right = node.left, node.right
+            left_height = 0 if left is None else left.height
+            right_height = 0 if right is None else right.height
+            node.height = 1 + (left_height if left_height > right_height else right_height)
+            if order_statistic:
+                node.size = 1 + (0 if left is None else left.size) + (0 if right is None else right.size)
+    return root, nodes
+
+
+def _load_btree(tree, chunks):
+    """
+    Link the nodes of a pre-order B-Tree dump and return (root, nodes in pre-order).
+    Every internal node waits on a stack until its n+1 children are read.
+    The leaves of a B+ Tree are read in key order, so they are linked as they come.
+    """
+
+    plus = isinstance(tree, BPlusTree)
+    nodes = []
+    root = None
+    stack = []  # [node, number of children already read]
+    last_leaf = None
+    for count, words, keys, values in chunks:
+        words = array('I', words)
+        if keys is None:
+            keys = [None] * sum(word & ~LEAF for word in words)
+        key_pos = value_pos = 0
+        for word in words:
+            n = word & ~LEAF
+            node = tree._new_node(bool(word & LEAF))
+            node.keys = keys[key_pos:key_pos + n]
+            node.n = n
+            key_pos += n
+            if stack:
+                entry = stack[-1]
+                entry[0].C[entry[1]] = node
+                entry[1] += 1
+                if entry[1] == entry[0].n + 1:
+                    stack.pop()
+            elif root is None:
+                root = node
+            else:
+                raise ValueError('Corrupted tree dump: nodes after the last leaf')
+            nodes.append(node)
+
+            if not node.is_leaf:
+                stack.append([node, 0])
+            elif plus:
+                if values is not None:
+                    node.values = values[value_pos:value_pos + n]
+                else:
+                    node.values = [None] * n
+                value_pos += n
+                node.prev = last_leaf
+                if last_leaf is not None:
+                    last_leaf.next = node
+                last_leaf = node
+        if key_pos != len(keys) or (values is not None and value_pos != len(values)):
+            raise ValueError('Corrupted tree dump: wrong number of keys')
+    if stack:
+        raise ValueError('Corrupted tree dump: missing nodes')
+
+    if tree.order_statistic:
+        for node in reversed(nodes):
+            node.size = tree._subtree_size(node)
+    return root, nodes
+
+
+"""
+Driver program to test above functions.
+"""
+# from red_black_tree import RBTree
+# myTree = RBTree()
+# for key in [5, 1, 9, 3]:
+#     myTree.insert(key)
+# data = dumps(myTree)
+# print(len(data), list(loads(data)))  # 100 [1, 3, 5, 9]
+#
+# # Corruption: every flipped byte and every truncation raises ValueError
+# from collections import Counter
+# errors = Counter()
+# for i in range(len(data)):
+#     for broken in (data[:i] + bytes([data[i] ^ 0xFF]) + data[i + 1:], data[:i]):
+#         try:
+#             loads(broken)
+#         except Exception as error:
+#             errors[type(error).__name__] += 1
+# print(errors)  # Counter({'ValueError': 200})
+
+
+"""
+Dump and load of 300000 random int keys against pickle and rebuilding by insert
+(CPython 3.11):
+                         insert     dump     load    file       pickle dumps/loads   file
+    AVLtree               5.15 s   1.03 s   0.43 s   2.6 MB       2.42 s / 4.02 s     9.4 MB
+    RBTree                8.35 s   1.51 s   1.09 s   2.6 MB       6.88 s / 9.23 s    22.6 MB
+    RBTree(compact=True)  3.21 s   0.97 s   0.60 s   2.6 MB       5.10 s / 4.42 s    13.4 MB
+    BTree(64)             1.08 s   0.27 s   0.13 s   2.3 MB       0.10 s / 0.12 s     2.1 MB
+A BST chain of 100000 nodes: dump 0.11 s, load 0.09 s; pickle raises RecursionError
+(and crashes the interpreter with a raised recursion limit).
+Without pausing the GC, the AVLtree load takes 2.5 s instead of 0.4 s.
+"""
+# import pickle
+# import random
+# import timeit
+# from avl_tree import AVLtree
+# myTree = AVLtree()
+# root = None
+# for key in random.sample(range(10 ** 9), 300000):
+#     root = myTree.insert(root, key)
+# t0 = timeit.default_timer()
+# data = dumps(myTree, root)
+# t1 = timeit.default_timer()
+# loads(data)
+# t2 = timeit.default_timer()
+# pickled = pickle.dumps((myTree, root), pickle.HIGHEST_PROTOCOL)
+# t3 = timeit.default_timer()
+# pickle.loads(pickled)
+# t4 = timeit.default_timer()
+# print(f'tree_io: dump {t1 - t0:.2f} s, load {t2 - t1:.2f} s, {len(data) / 2 ** 20:.1f} MB')
+# print(f'pickle: dump {t3 - t2:.2f} s, load {t4 - t3:.2f} s, {len(pickled) / 2 ** 20:.1f} MB')
@@ -0,0 +1,110 @@
+"""
+Python code shared by the trees of this repo for from_sorted, insert_many and delete_many
+"""
+from itertools import groupby
+from operator import attrgetter
+
+
+BATCH_REBUILD_RATIO = 4  # insert_many/delete_many rebuild trees of at most this many times the batch size
+
+
+def sorted_keys(iterable, sort, dedupe):
+    """
+    Materialize the keys given to from_sorted as a sorted list.
+    Raise ValueError if sort is False and the keys are not in ascending order.
+    """
+
+    keys = sorted(iterable) if sort else list(iterable)
+    if not sort:
+        for i in range(1, len(keys)):
+            if keys[i] < keys[i - 1]:
+                raise ValueError('from_sorted() requires sorted keys, pass sort=True for unsorted input')
+    if dedupe:
+        keys = [key for i, key in enumerate(keys) if i == 0 or keys[i - 1] != key]
+    return keys
+
+
+def merge_batch(items, batch, on_duplicate, new_node=None):
+    """
+    Merge the items of a tree (in key order) with a sorted batch of keys.
+    With new_node, the items are nodes holding their key in node.val, and every key of
+    the batch which is kept becomes new_node(key); without it, the items are the keys
+    themselves (a B-Tree) and the kept keys are merged as they are.
+    on_duplicate: 'keep', 'skip' or 'error' (see insert_many).
+    """
+
+    keys = items if new_node is None else list(map(attrgetter('val'), items))
+    n = len(keys)
+    merged = []
+    i = 0
+    for j, key in enumerate(batch):
+        while i < n and keys[i] < key:
+            merged.append(items[i])
+            i += 1
+        # A repeated batch key was kept, or skipped for being in the tree, the first time
+        if on_duplicate != 'keep' and ((i < n and keys[i] == key) or (j > 0 and batch[j - 1] == key)):
+            if on_duplicate == 'error':
+                raise KeyError(key)
+            continue
+        merged.append(key if new_node is None else new_node(key))
+    merged += items[i:]
+    return merged
+
+
+def subtract_batch(items, batch, on_missing, nodes=True):
+    """
+    Drop one item for every key of the sorted batch from the items of a tree (in key order):
+    nodes holding their key in node.val, or the keys themselves (a B-Tree) if nodes is False.
+    Return the remaining items.
+    on_missing: 'ignore' or 'error' (see delete_many).
+    """
+
+    keys = list(map(attrgetter('val'), items)) if nodes else items
+    n = len(keys)
+    remaining = []
+    i = 0
+    for key in batch:
+        while i < n and keys[i] < key:
+            remaining.append(items[i])
+            i += 1
+        if i < n and keys[i] == key:
+            i += 1
+        elif on_missing == 'error':
+            raise KeyError(key)
+    remaining += items[i:]
+    return remaining
+
+
+def check_option(name, value, choices):
+    if value not in choices:
+        raise ValueError(f'{name} must be one of {choices}, not {value!r}')
+
+
+def reject_duplicates(batch, contains):
+    """
+    Raise KeyError for the first key of the sorted batch which is repeated in the batch,
+    or already in the tree according to contains(key).
+    """
+
+    for i, key in enumerate(batch):
+        if (i > 0 and batch[i - 1] == key) or contains(key):
+            raise KeyError(key)
+
+
+def reject_missing(batch, count):
+    """
+    Raise KeyError for the first key of the sorted batch which occurs more often in the
+    batch than in the tree. count(key, limit) returns the copies of key in the tree, up to limit.
+    """
+
+    for key, group in groupby(batch):
+        needed = sum(1 for _ in group)
+        if count(key, needed) < needed:
+            raise KeyError(key)
+
+
+"""
+Driver program to test above functions.
+"""
+# print(merge_batch([1, 3, 5], [2, 3, 3, 6], 'skip'))  # [1, 2, 3, 5, 6]
+# print(subtract_batch([1, 3, 3, 5], [3, 4], 'ignore', nodes=False))  # [1, 3, 5]